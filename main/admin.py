@@ -27,6 +27,8 @@ class FinancialAccountAdmin(ModelAdmin):
         "needs_attention",
     )
     search_fields = ("person__user__email", "item_id", "access_token", "name")
+    # The list shows the person and institution; `Person.__str__` uses the username.
+    list_select_related = ["person__user", "institution"]
 
 
 @admin.register(models.SubAccount)
@@ -71,6 +73,8 @@ class TransactionAdmin(ModelAdmin):
         "plaid_id",
         "merchant",
     )
+    # `FinancialAccount.__str__` uses the person's username, and the institution.
+    list_select_related = ["account__person__user", "account__institution"]
 
 
 @admin.register(models.RecurringTransaction)
@@ -82,12 +86,14 @@ class RecurringAdmin(ModelAdmin):
 class CategoryRuleAdmin(ModelAdmin):
     list_display = ("person", "description", "category")
     search_fields = ("person__user__email", "description", "category")
+    list_select_related = ["person__user"]
 
 
 @admin.register(models.CategoryCustom)
 class CustomCategoryAdmin(ModelAdmin):
     list_display = ("id", "person", "name")
     search_fields = ("name",)
+    list_select_related = ["person__user"]
 
 
 @admin.register(models.SnapshotAccount)
@@ -100,9 +106,46 @@ class SnapAccountAdmin(ModelAdmin):
 class SnapPersonAdmin(ModelAdmin):
     list_display = ("person", "dt", "value")
     search_fields = ("value",)
+    list_select_related = ["person__user"]
 
 
 @admin.register(models.BudgetItem)
 class BudgetItemAdmin(ModelAdmin):
     list_display = ("person", "category", "amount", "notes")
     # search_fields = ("value",)
+    list_select_related = ["person__user"]
+
+
+@admin.register(models.MonthlyCategoryTotal)
+class MonthlyCategoryTotalAdmin(ModelAdmin):
+    list_display = ("person", "month", "category", "ignored", "total", "count")
+    list_select_related = ["person__user"]
+
+
+@admin.register(models.SyncJob)
+class SyncJobAdmin(ModelAdmin):
+    list_display = ("person", "status", "created", "started", "finished", "new_data")
+    list_filter = ("status",)
+    list_select_related = ["person__user"]
+
+
+@admin.register(models.ImportJob)
+class ImportJobAdmin(ModelAdmin):
+    list_display = (
+        "person",
+        "status",
+        "created",
+        "finished",
+        "rows_processed",
+        "inserted",
+        "skipped",
+        "malformed",
+    )
+    list_filter = ("status",)
+    exclude = ("file",)
+    list_select_related = ["person__user"]
+
+
+@admin.register(models.AssetPrice)
+class AssetPriceAdmin(ModelAdmin):
+    list_display = ("asset_type", "price", "updated", "refresh_started")
@@ -4,18 +4,45 @@ this functionality, users enter asset identifiers, and quanity; totals are calcu
 and prices pulled (and cached) from web APIs.
 """
 
-from datetime import datetime
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from enum import Enum
+from typing import Dict, Iterable, List, Optional
+
 import requests
+from django.db import connection
+from django.db.models import Q
 from django.utils import timezone
 
-# from main.util import send_debug_email
+from wallet.settings import ASSET_PRICE_PROVIDER
 
-# We cache remotely-loaded prices for performance reasons; no need to make their HTTP call every time
-# we load an asset's value. Cache them in memory.
-ASSET_PRICE_CACHE = {}  # { CryptoType: (value, datetime) }
+# from main.util import send_debug_email
 
+# Unit prices are stored in the `AssetPrice` table, shared by all processes. Prices older than this
+# are refreshed in the background; until the refresh completes, we keep serving the stored price.
 ASSET_TIMEOUT = 60 * 60  # seconds
+# A hard limit on price requests, so a slow API can't tie up a refresh thread.
+FETCH_TIMEOUT = 5  # seconds
+# A refresh claimed longer ago than this is assumed to have failed, and may be retried. This also
+# limits how often we retry when the API is down.
+REFRESH_CLAIM_TIMEOUT = 60  # seconds
+
+# Coinbase returns at most this many daily candles per request.
+CANDLES_PER_REQUEST = 300
+# When valuing holdings on a day we don't have a price for, we use the most recent price up to this
+# many days earlier.
+MAX_PRICE_GAP = 7  # days
+
+NEVER = timezone.make_aware(datetime.fromisoformat("1999-09-09"))
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="asset-price")
+
+# Refreshes running in this process, by asset. Callers needing an asset that's already being
+# refreshed wait on that, vice fetching it again.
+_in_flight: Dict["CryptoType", Future] = {}
+_in_flight_lock = threading.Lock()
 
 
 # todo: DRY with models due to Python's import system
@@ -53,31 +80,348 @@ class CryptoType(Enum):
             print("\nError: fallthrough on Crypto type")
 
     def account_value(self, quantity: float) -> float:
-        """
-        Get an account's value of this cryptocurrency,in USD.
-        https://docs.cloud.coinbase.com/sign-in-with-coinbase/docs/api-prices
-        """
-        cache_details = ASSET_PRICE_CACHE.get(
-            self, [0.0, timezone.make_aware(datetime.fromisoformat("1999-09-09"))]
-        )
+        """Get an account's value of this cryptocurrency, in USD."""
+        return unit_price(self) * quantity
 
-        now = timezone.now()
-        if (now - cache_details[1]).seconds > ASSET_TIMEOUT:
 
-            # todo temp
-            print(f"\n\n Refreshing asset: {self} \n\n\n")
+class PriceProvider(ABC):
+    """A source of asset prices. Subclasses must implement each method; this is checked when they're
+    created, vice when a background refresh first calls one."""
+
+    @abstractmethod
+    def fetch_prices(self, assets: List[CryptoType]) -> Dict[CryptoType, float]:
+        """Load unit prices, in USD. Assets whose price is unavailable are omitted."""
 
+    @abstractmethod
+    def fetch_daily_prices(
+        self, asset: CryptoType, start: date, end: date
+    ) -> Dict[date, float]:
+        """Load an asset's daily closing prices, in USD, over a date range, inclusive. Days whose
+        price is unavailable are omitted."""
+
+
+class CoinbaseProvider(PriceProvider):
+    """Loads spot prices from Coinbase. Its API has one endpoint per asset, so we request them
+    concurrently.
+    https://docs.cloud.coinbase.com/sign-in-with-coinbase/docs/api-prices
+    """
+
+    def fetch_prices(self, assets: List[CryptoType]) -> Dict[CryptoType, float]:
+        if not assets:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=len(assets)) as executor:
+            prices = executor.map(self.fetch_price, assets)
+
+        return {
+            asset: price for asset, price in zip(assets, prices) if price is not None
+        }
+
+    def fetch_price(self, asset: CryptoType) -> Optional[float]:
+        """Returns None if unavailable."""
+        try:
             data = requests.get(
-                f"https://api.coinbase.com/v2/prices/{self.abbrev()}-usd/spot"
+                f"https://api.coinbase.com/v2/prices/{asset.abbrev()}-usd/spot",
+                timeout=FETCH_TIMEOUT,
             ).json()
-            price = float(data["data"]["amount"]) * quantity
+            price = float(data["data"]["amount"])
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading the price of {asset}: {e}")
+            return None
+
+        if price == 0:  # Troubleshooting. Do we get this?
+            # todo: circular import problem preventing sending a debug email here.
+            # util.send_debug_email("0 asset price on crypto")
+            return None
+
+        return price
+
+    def fetch_daily_prices(
+        self, asset: CryptoType, start: date, end: date
+    ) -> Dict[date, float]:
+        """Uses Coinbase Exchange's daily candles.
+        https://docs.cdp.coinbase.com/exchange/reference/exchangerestapi_getproductcandles
+        """
+        result = {}
+
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=CANDLES_PER_REQUEST - 1), end)
+
+            try:
+                candles = requests.get(
+                    f"https://api.exchange.coinbase.com/products/{asset.abbrev().upper()}-USD/candles",
+                    params={
+                        "granularity": 24 * 60 * 60,
+                        "start": chunk_start.isoformat(),
+                        "end": chunk_end.isoformat(),
+                    },
+                    timeout=FETCH_TIMEOUT,
+                ).json()
+
+                # Each candle is [time, low, high, open, close, volume].
+                for candle in candles:
+                    day = datetime.fromtimestamp(candle[0], tz=dt_timezone.utc).date()
+                    result[day] = float(candle[4])
+            except (requests.RequestException, ValueError, IndexError, TypeError) as e:
+                print(f"Error loading daily prices of {asset} from {chunk_start}: {e}")
+
+            chunk_start = chunk_end + timedelta(days=1)
+
+        return result
+
+
+class StaticProvider(PriceProvider):
+    """Fixed prices, for use without network access, eg in tests and benchmarks."""
+
+    DEFAULT_PRICES = {
+        CryptoType.Bitcoin: 60_000.0,
+        CryptoType.Ethereum: 3_000.0,
+        CryptoType.Bnb: 500.0,
+        CryptoType.Solana: 150.0,
+        CryptoType.Xrp: 0.5,
+    }
+
+    def __init__(self, prices: Optional[Dict[CryptoType, float]] = None):
+        self.prices = self.DEFAULT_PRICES if prices is None else prices
+
+    def fetch_prices(self, assets: List[CryptoType]) -> Dict[CryptoType, float]:
+        return {asset: self.prices[asset] for asset in assets if asset in self.prices}
+
+    def fetch_daily_prices(
+        self, asset: CryptoType, start: date, end: date
+    ) -> Dict[date, float]:
+        if asset not in self.prices:
+            return {}
+
+        return {
+            start + timedelta(days=i): self.prices[asset]
+            for i in range((end - start).days + 1)
+        }
+
+
+PROVIDERS = {
+    "coinbase": CoinbaseProvider,
+    "static": StaticProvider,
+}
+
+# Replace this to use a different source, eg `StaticProvider` in tests.
+provider: PriceProvider = PROVIDERS[ASSET_PRICE_PROVIDER]()
+
+
+def _refresh_in_thread(assets: List[CryptoType]) -> None:
+    """Fetch prices for a batch of assets, and store them. The caller must have claimed their
+    refreshes; see `claim_refresh`. On failure, claims are left in place, so we don't retry until
+    they expire."""
+    # Imported here, since `models` imports this module.
+    from main.models import AssetPrice
+
+    try:
+        prices = provider.fetch_prices(assets)
+
+        now = timezone.now()
+        for asset, price in prices.items():
+            AssetPrice.objects.filter(asset_type=asset.value).update(
+                price=price, updated=now, refresh_started=None
+            )
+
+        # Keep today's entry in the history current; it's final once the day is over.
+        save_daily_prices(
+            {asset: {timezone.localdate(now): price} for asset, price in prices.items()}
+        )
+    except Exception as e:
+        print(f"Error refreshing prices of {assets}: {e}")
+    finally:
+        with _in_flight_lock:
+            for asset in assets:
+                _in_flight.pop(asset, None)
+
+        # Django opens a separate database connection per thread; make sure it's not left open.
+        connection.close()
+
+
+def claim_refresh(asset: CryptoType) -> bool:
+    """Mark an asset's price as being refreshed. Returns False if another process is already
+    refreshing it, so only one fetches it at a time."""
+    from main.models import AssetPrice
+
+    now = timezone.now()
+    abandoned = now - timedelta(seconds=REFRESH_CLAIM_TIMEOUT)
+
+    return (
+        AssetPrice.objects.filter(asset_type=asset.value)
+        .filter(Q(refresh_started__isnull=True) | Q(refresh_started__lt=abandoned))
+        .update(refresh_started=now)
+        > 0
+    )
+
+
+def refresh_prices(assets: Iterable[CryptoType]) -> List[Future]:
+    """Refresh prices in the background, fetching all assets not already being refreshed in one
+    batch. Returns futures that complete when the refreshes do; this includes ones that were
+    already in flight in this process. Assets being refreshed by other processes are skipped.
+    """
+    futures = set()
+    candidates = []
+    # Registered for the assets we may refresh, before claiming them, so other threads in this
+    # process wait on it, vice trying to claim them too.
+    pending = Future()
+
+    with _in_flight_lock:
+        for asset in assets:
+            if asset in _in_flight:
+                futures.add(_in_flight[asset])
+            else:
+                _in_flight[asset] = pending
+                candidates.append(asset)
+
+    if not candidates:
+        return list(futures)
+
+    # Claims are database round trips; make them without holding the lock, which every stale
+    # price lookup in this process takes.
+    to_fetch = []
+    submitted = False
+    try:
+        to_fetch = [asset for asset in candidates if claim_refresh(asset)]
+
+        if to_fetch:
+            batch = _refresh_executor.submit(_refresh_in_thread, to_fetch)
+            batch.add_done_callback(lambda _: pending.set_result(None))
+            submitted = True
+    finally:
+        with _in_flight_lock:
+            # Assets claimed by other processes, or all if claiming failed, aren't in flight here.
+            for asset in candidates:
+                if not submitted or asset not in to_fetch:
+                    _in_flight.pop(asset, None)
+
+        if not submitted:
+            pending.set_result(None)
+
+    futures.add(pending)
+    return list(futures)
+
+
+def unit_prices(assets: Iterable[CryptoType]) -> Dict[CryptoType, float]:
+    """Unit prices, in USD, from the shared price table. Prices that are out of date are returned
+    anyway, and refreshed in the background. Only if we've never loaded an asset's price do we wait
+    on the refresh, for up to `FETCH_TIMEOUT`; its price is 0 if that fails."""
+    from main.models import AssetPrice
+
+    assets = set(assets)
+    if not assets:
+        return {}
+
+    rows = AssetPrice.objects.filter(asset_type__in=[a.value for a in assets])
+    rows = {row.asset_type: row for row in rows}
+
+    missing = [a for a in assets if a.value not in rows]
+    if missing:
+        AssetPrice.objects.bulk_create(
+            [AssetPrice(asset_type=a.value, price=0.0, updated=NEVER) for a in missing],
+            ignore_conflicts=True,
+        )
+        for row in AssetPrice.objects.filter(asset_type__in=[a.value for a in missing]):
+            rows[row.asset_type] = row
+
+    now = timezone.now()
+    stale = [
+        a
+        for a in assets
+        if (now - rows[a.value].updated).total_seconds() > ASSET_TIMEOUT
+    ]
+
+    if stale:
+        futures = refresh_prices(stale)
+
+        # There's no stored price to serve for these.
+        never_loaded = [a.value for a in stale if rows[a.value].updated == NEVER]
+        if never_loaded:
+            wait(futures, timeout=FETCH_TIMEOUT)
+            for row in AssetPrice.objects.filter(asset_type__in=never_loaded):
+                rows[row.asset_type] = row
+
+    return {a: rows[a.value].price for a in assets}
+
+
+def unit_price(asset: CryptoType) -> float:
+    """An asset's unit price, in USD. See `unit_prices`."""
+    return unit_prices([asset])[asset]
+
+
+def prefetch_prices(sub_accounts: Iterable) -> None:
+    """Load prices of the assets held by these sub-accounts together, vice one at a time as
+    `get_value` is called on each. Stores the price on each sub-account."""
+    sub_accounts = [s for s in sub_accounts if s.asset_type is not None]
+
+    prices = unit_prices(CryptoType(s.asset_type) for s in sub_accounts)
+
+    for sub_acc in sub_accounts:
+        sub_acc.asset_price = prices[CryptoType(sub_acc.asset_type)]
+
+
+def save_daily_prices(prices: Dict[CryptoType, Dict[date, float]]) -> int:
+    """Insert or update daily prices, in bulk. Returns the number of rows written."""
+    from main.models import AssetPriceDaily
+
+    rows = [
+        AssetPriceDaily(asset_type=asset.value, date=day, price=price)
+        for asset, by_date in prices.items()
+        for day, price in by_date.items()
+    ]
+
+    AssetPriceDaily.objects.bulk_create(
+        rows,
+        batch_size=1_000,
+        update_conflicts=True,
+        unique_fields=["asset_type", "date"],
+        update_fields=["price"],
+    )
+
+    return len(rows)
+
+
+def backfill_daily_prices(assets: Iterable[CryptoType], start: date, end: date) -> int:
+    """Load daily prices over a date range, inclusive, from the provider, and store them. Assets are
+    fetched concurrently. Returns the number of rows written."""
+    assets = list(assets)
+    if not assets:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=len(assets)) as executor:
+        results = executor.map(
+            lambda asset: provider.fetch_daily_prices(asset, start, end), assets
+        )
+
+    return save_daily_prices(dict(zip(assets, results)))
+
+
+def daily_prices(
+    assets: Iterable[CryptoType], start: date, end: date
+) -> Dict[CryptoType, Dict[date, float]]:
+    """Stored daily prices over a date range, inclusive, with a single query."""
+    from main.models import AssetPriceDaily
+
+    result = {asset: {} for asset in assets}
+
+    rows = AssetPriceDaily.objects.filter(
+        asset_type__in=[a.value for a in result], date__range=(start, end)
+    ).values_list("asset_type", "date", "price")
+
+    for asset_type, day, price in rows:
+        result[CryptoType(asset_type)][day] = price
+
+    return result
 
-            if price == 0:  # Troubleshooting. Do we get this?
-                # todo: circular import problem preventing sending a debug email here.
-                # util.send_debug_email("0 asset price on crypto")
-                return cache_details[0]
 
-            ASSET_PRICE_CACHE[self] = (price, now)
+def price_on(prices: Dict[date, float], day: date) -> Optional[float]:
+    """The price on a day, from `daily_prices` output. If missing, eg if the day is today and we
+    haven't recorded it yet, uses the most recent earlier price, up to `MAX_PRICE_GAP` days back.
+    """
+    for days_back in range(MAX_PRICE_GAP + 1):
+        price = prices.get(day - timedelta(days=days_back))
+        if price is not None:
             return price
 
-        return cache_details[0]
+    return None
@@ -3,103 +3,204 @@ import csv
 import json
 from dataclasses import dataclass
 import datetime
-from io import StringIO, TextIOWrapper
-from typing import List, Iterable
+from io import StringIO
+from typing import Callable, Dict, Iterator, List, Iterable, Optional, TextIO
 
-from django.db import OperationalError, IntegrityError
-from django.db.utils import DataError
-from django.http import HttpResponse
+from django.db import transaction
 
-from . import transaction_cats
+from . import transaction_cats, rollups
 from .models import Transaction, Person
-from .transaction_cats import TransactionCategory
-from .util import send_debug_email
+from .transaction_cats import (
+    CATEGORY_DISPLAY_NAMES,
+    RuleMatcher,
+    TransactionCategory,
+    normalize_description,
+)
+from .util import data_changed, rule_matcher
 
+# Rows parsed and saved per batch, when importing.
+IMPORT_BATCH_SIZE = 1_000
+# Rows read from the database per query, when exporting.
+EXPORT_CHUNK_SIZE = 2_000
 
-def import_csv_mint(csv_data: TextIOWrapper, person: Person) -> None:
-    """Parse CSV from mint; update the database accordingly."""
-    reader = csv.reader(csv_data)
 
-    # Skip the header
+@dataclass
+class ImportResult:
+    """Row counts from importing a CSV file."""
+
+    inserted: int = 0
+    # Duplicates, either within the file, or of transactions already loaded.
+    skipped: int = 0
+    # Rows we couldn't parse.
+    malformed: int = 0
+
+    @property
+    def processed(self) -> int:
+        return self.inserted + self.skipped + self.malformed
+
+
+def parse_mint_row(row: List[str], person: Person, rules: RuleMatcher) -> Transaction:
+    """Create an unsaved transaction from a row of a Mint CSV file. Raises `ValueError` or
+    `IndexError` if the row is malformed."""
+    amount = float(row[3])
+
+    # transaction type. Mint always reports positive values, then deliniates as "credit" or "debit".
+    if row[4] == "debit":
+        amount *= -1
+
+    date = datetime.datetime.strptime(row[0], "%m/%d/%Y").date()
+
+    description = row[1]
+
+    category = TransactionCategory.from_str(row[5])
+    category = transaction_cats.category_override(description, category, rules)
+
+    return Transaction(
+        # Associate this transaction directly with the person, vice the account.
+        person=person,
+        owner=person,
+        # Exactly one category, including "Uncategorized" is reported by Mint
+        category=category.value,
+        amount=amount,
+        description=description,
+        # We bulk-create these, so `save` doesn't set this.
+        description_norm=normalize_description(description),
+        date=date,
+        currency_code="USD",  # todo: Allow the user to select this A/R.
+        notes=row[8],
+        institution_name=row[6],
+        # todo: Merchant?
+    )
+
+
+def import_batch(
+    rows: List[List[str]], person: Person, rules: RuleMatcher, result: ImportResult
+) -> None:
+    """Parse and save a batch of Mint CSV rows, skipping duplicates, and update the rollup for the
+    months they're in. Updates `result` in place."""
+    # Keyed by the fields of the unique constraint on imported transactions.
+    new = {}
+    for row in rows:
+        try:
+            tran = parse_mint_row(row, person, rules)
+        except (ValueError, IndexError) as e:
+            print(f"Skipping malformed row in CSV import: {row}, {e}")
+            result.malformed += 1
+            continue
+
+        key = (tran.date, tran.description, tran.amount)
+        if key in new:
+            result.skipped += 1
+        else:
+            new[key] = tran
+
+    if not new:
+        return
+
+    # Saving the rollup with the batch keeps it consistent with the rows saved, even if a later
+    # batch fails.
+    with transaction.atomic():
+        # Serializes imports, and manual adds, for this person, so no rows matching this batch can
+        # be added between the duplicate check below and the insert.
+        Person.objects.select_for_update().filter(id=person.id).first()
+
+        # Check for duplicates of existing transactions with one query per batch, vice one per row.
+        existing = set(
+            Transaction.objects.filter(
+                person=person,
+                date__in={date for date, _, _ in new},
+                description__in={description for _, description, _ in new},
+            ).values_list("date", "description", "amount")
+        )
+
+        to_create = [tran for key, tran in new.items() if key not in existing]
+        result.skipped += len(new) - len(to_create)
+
+        if not to_create:
+            return
+
+        created = Transaction.objects.bulk_create(to_create)
+
+        rollups.refresh_monthly_totals(person, {tran.date for tran in created})
+
+    result.inserted += len(created)
+
+
+def decode_csv(data: bytes) -> str:
+    """Decode an uploaded CSV file. Mint exports are UTF-8, but files edited in other programs may
+    be Latin-1, which decodes any bytes."""
     try:
-        next(reader)
+        # `utf-8-sig` also removes the byte order mark some editors add.
+        return data.decode("utf-8-sig")
     except UnicodeDecodeError:
-        msg = f"UTF-8 import failed; trying ISO."
-        print(msg)
-        send_debug_email(msg)
+        print("CSV file isn't UTF-8; decoding as Latin-1.")
+        return data.decode("ISO-8859-1")
 
-        reader = csv.reader(csv_data, encoding="ISO-8859-1")
-        try:
-            next(reader)
-        except UnicodeDecodeError:
-            msg = f"Error decoding CSV; both UTF-8 and ISO. \n{csv_data}"
-            print(msg)
-            send_debug_email(msg)
-            return None
 
-    # categories = JSONField()  # List of category enums, eg [0, 2]
-    # amount = FloatField()
+def import_csv_mint(
+    csv_data: TextIO,
+    person: Person,
+    on_batch: Optional[Callable[[ImportResult], None]] = None,
+) -> ImportResult:
+    """Parse CSV from mint; update the database accordingly. Rows are parsed, categorized, and
+    saved in batches of `IMPORT_BATCH_SIZE`; `on_batch` is called with running totals after each,
+    eg to report progress. `csv_data` is text; see `decode_csv`."""
+    reader = csv.reader(csv_data)
+
+    # Skip the header
+    next(reader, None)
 
     # todo: We currently leave out the labels field, and original description.
-    # categoory, tra
-    # Iterate over the CSV rows and create Transaction objects
 
-    rules = person.category_rules.all()
+    rules = rule_matcher(person)
+    result = ImportResult()
 
+    batch = []
     for row in reader:
-        try:
-            amount = float(row[3])
-        except ValueError:
-            print("Error: Invalid amount. Probably wrong spreadsheet format.")
-            amount = 0.0
-
-        # transaction type. Mint always reports positive values, then deliniates as "credit" or "debit".
-        if row[4] == "debit":
-            amount *= -1
-
-        # todo: Error handlign in this function in general.
-
-        # Convert the date to iso format.
-        d = datetime.datetime.strptime(row[0], "%m/%d/%Y")
-        date = d.date().isoformat()
-
-        description = row[1]
-
-        category = TransactionCategory.from_str(row[5])
-        category = transaction_cats.category_override(description, category, rules)
-
-        transaction = Transaction(
-            # Associate this transaction directly with the person, vice the account.
-            person=person,
-            # Exactly one category, including "Uncategorized" is reported by Mint
-            category=category.value,
-            amount=amount,
-            description=description,
-            date=date,
-            currency_code="USD",  # todo: Allow the user to select this A/R.
-            notes=row[8],
-            institution_name=row[6],
-            # todo: Merchant?
-        )
-        try:
-            transaction.save()
-        except OperationalError as e:
-            print(
-                "Unable to save this transaction (Operational error): ", e, transaction
-            )
-        except DataError as e:
-            print("Unable to save this transaction (Data error): ", e, transaction)
-        except IntegrityError:
-            # Eg a duplicate.
-            pass
-
-
-def export_csv(transactions: Iterable[Transaction], output: HttpResponse) -> str:
-    """Export a CSV, using Mint's format, augmented with extra fields as required."""
-    writer = csv.writer(output)
-
-    # Write the header
-    writer.writerow(
+        batch.append(row)
+
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            import_batch(batch, person, rules, result)
+            batch = []
+
+            # Batches are committed as we go, so invalidate the cached dashboard after each; this
+            # way, it's current even if a later batch fails.
+            data_changed(person)
+
+            if on_batch is not None:
+                on_batch(result)
+
+    import_batch(batch, person, rules, result)
+    data_changed(person)
+
+    return result
+
+
+class Echo:
+    """A pseudo-buffer that returns what's written to it. This lets us stream rows formatted by
+    `csv.writer`, vice collecting them in memory."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def category_names(person: Person) -> Dict[int, str]:
+    """Category value to display name, including the person's custom categories."""
+    result = dict(CATEGORY_DISPLAY_NAMES)
+    for id_, name in person.custom_cats.values_list("id", "name"):
+        # Custom categories are stored on transactions as 1000 + their ID.
+        result[1_000 + id_] = name
+
+    return result
+
+
+def export_csv(person: Person) -> Iterator[str]:
+    """Export a person's transactions as CSV, using Mint's format, augmented with extra fields as
+    required. This yields one line at a time, and reads from the database in chunks, so memory use
+    doesn't grow with the number of transactions."""
+    writer = csv.writer(Echo())
+
+    yield writer.writerow(
         [
             "Date",
             "Description",
@@ -114,33 +215,45 @@ def export_csv(transactions: Iterable[Transaction], output: HttpResponse) -> str
         ]
     )
 
-    for transaction in transactions:
+    cat_names = category_names(person)
+    uncategorized = cat_names[TransactionCategory.UNCATEGORIZED.value]
+
+    rows = (
+        Transaction.objects.filter(owner=person)
+        .order_by("-date", "-id")
+        .values_list(
+            "date",
+            "description",
+            "amount",
+            "category",
+            "institution_name",
+            "notes",
+            "merchant",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    for date, description, amount, category, institution_name, notes, merchant in rows:
         # Convert the amount to a positive number and determine the transaction type
-        if transaction.amount < 0:
-            amount = -transaction.amount
+        if amount < 0:
+            amount = -amount
             transaction_type = "debit"
         else:
-            amount = transaction.amount
             transaction_type = "credit"
 
         # Writing the row according to Mint's CSV format
-        # Assuming `transaction.description` maps to both "Description" and "Original Description" as per Mint's format
-
-        writer.writerow(
+        yield writer.writerow(
             [
-                transaction.date,
-                transaction.description,
+                date,
+                description,
                 "",  # "Original description"
                 amount,
                 transaction_type,
-                TransactionCategory(transaction.category).to_str(),
+                cat_names.get(category, uncategorized),
                 # todo: Sub-account info?
-                transaction.institution_name,
+                institution_name,
                 "",  # Labels are skipped as per the provided code snippet
-                transaction.notes,
-                transaction.merchant,
+                notes,
+                merchant,
             ]
         )
-
-    # Return the CSV data as a string
-    return output.getvalue()
@@ -0,0 +1,204 @@
+"""
+A database-backed queue for syncing linked accounts with Plaid, and importing CSV files. Views
+enqueue jobs, and the `run_sync_worker` management command runs them, so web workers don't block on
+Plaid requests or large imports.
+"""
+
+import traceback
+from datetime import timedelta
+from io import StringIO
+from typing import Optional, Union
+
+from django.db import transaction
+from django.utils import timezone
+
+# `util` must load before `plaid_`, due to a circular import between them.
+from main import util, plaid_, export
+from main.models import ImportJob, JobStatus, Person, SyncJob
+
+HOUR = 60 * 60
+
+# Running jobs whose heartbeat is older than this are assumed to belong to a worker that died, and
+# are re-queued. Imports update theirs after each batch.
+STALE_JOB_TIMEOUT = 15 * 60  # seconds.
+# Finished jobs are kept this long, so the dashboard can poll their status.
+FINISHED_JOB_RETENTION = 24 * HOUR  # seconds.
+
+PENDING = [JobStatus.QUEUED.value, JobStatus.RUNNING.value]
+
+# Job types, in the order workers pick them up. Syncs are quick, and block the dashboard, so they
+# go first.
+JOB_MODELS = [SyncJob, ImportJob]
+
+
+def enqueue_sync(person: Person) -> Optional[SyncJob]:
+    """Queue a sync of a person's linked accounts, if any are due for a refresh. If a sync is
+    already queued or running for them, returns that instead of queuing another."""
+    now = timezone.now()
+
+    if not any(plaid_.refresh_due(acc, now) for acc in person.accounts.all()):
+        return None
+
+    with transaction.atomic():
+        # Locking the person prevents concurrent dashboard loads from queuing duplicate jobs.
+        Person.objects.select_for_update().filter(id=person.id).first()
+
+        job = SyncJob.objects.filter(person=person, status__in=PENDING).first()
+        if job is None:
+            job = SyncJob.objects.create(person=person, created=now)
+
+    return job
+
+
+def enqueue_import(person: Person, data: bytes) -> ImportJob:
+    """Queue an import of a Mint CSV file."""
+    return ImportJob.objects.create(person=person, file=data, created=timezone.now())
+
+
+def claim_next_job() -> Optional[Union[SyncJob, ImportJob]]:
+    """Mark the oldest queued job of the first type in `JOB_MODELS` that has one as running, and
+    return it. Rows locked by other workers are skipped, so multiple workers can run concurrently.
+    """
+    for model in JOB_MODELS:
+        with transaction.atomic():
+            job = (
+                # Only lock the job, vice joined rows.
+                model.objects.select_for_update(skip_locked=True, of=("self",))
+                # The worker logs the job, including its person's username.
+                .select_related("person__user")
+                .filter(status=JobStatus.QUEUED.value)
+                .order_by("created")
+                .first()
+            )
+            if job is None:
+                continue
+
+            job.status = JobStatus.RUNNING.value
+            job.started = timezone.now()
+            job.heartbeat = job.started
+            job.save(update_fields=["status", "started", "heartbeat"])
+
+        return job
+
+    return None
+
+
+def run_job(job: Union[SyncJob, ImportJob]) -> None:
+    """Run a claimed job, recording its result."""
+    if isinstance(job, ImportJob):
+        run_import_job(job)
+    else:
+        run_sync_job(job)
+
+
+def run_sync_job(job: SyncJob) -> None:
+    """Refresh a person's accounts and recurring transactions from Plaid, and if new data was
+    loaded, save snapshots."""
+    person = job.person
+    # Adding transactions uses the institution name.
+    accounts = person.accounts.select_related("institution")
+
+    try:
+        job.new_data = plaid_.update_accounts(accounts)
+
+        if job.new_data:
+            # Save snapshots, for use with charts, etc
+            util.take_snapshots(person)
+
+        job.status = JobStatus.DONE.value
+    except Exception as e:
+        print(f"Error running sync job {job}: {e}")
+        job.status = JobStatus.FAILED.value
+        job.error = traceback.format_exc()
+
+    # Balances, transactions, or account health may have changed, even if the sync failed partway.
+    util.data_changed(person)
+
+    job.finished = timezone.now()
+    job.save()
+
+
+class JobLost(Exception):
+    """Raised when a job this worker is running was re-queued, eg since its heartbeat stalled, so
+    another worker may be running it."""
+
+
+def record_import_progress(job: ImportJob, result: export.ImportResult) -> None:
+    """Save an import's running totals, so the status endpoint can report progress, and update its
+    heartbeat. Raises `JobLost` if the job's no longer ours."""
+    job.rows_processed = result.processed
+    job.inserted = result.inserted
+    job.skipped = result.skipped
+    job.malformed = result.malformed
+    job.heartbeat = timezone.now()
+
+    updated = ImportJob.objects.filter(
+        id=job.id, status=JobStatus.RUNNING.value, started=job.started
+    ).update(
+        rows_processed=job.rows_processed,
+        inserted=job.inserted,
+        skipped=job.skipped,
+        malformed=job.malformed,
+        heartbeat=job.heartbeat,
+    )
+
+    if not updated:
+        raise JobLost(f"{job} was re-queued while running")
+
+
+def run_import_job(job: ImportJob) -> None:
+    """Import an uploaded Mint CSV file, in batches, recording progress after each."""
+    try:
+        csv_data = StringIO(export.decode_csv(job.file), newline="")
+        result = export.import_csv_mint(
+            csv_data, job.person, lambda r: record_import_progress(job, r)
+        )
+
+        record_import_progress(job, result)
+        job.status = JobStatus.DONE.value
+    except JobLost as e:
+        # Leave the job to the worker that has it now; rows we saved are skipped as duplicates.
+        print(f"Abandoning import job: {e}")
+        return
+    except Exception as e:
+        print(f"Error running import job {job}: {e}")
+        job.status = JobStatus.FAILED.value
+        job.error = traceback.format_exc()
+
+    job.finished = timezone.now()
+    # We don't need the file anymore, and it may be large.
+    job.file = b""
+
+    # Only if it's still ours; see `record_import_progress`.
+    ImportJob.objects.filter(id=job.id, started=job.started).update(
+        status=job.status, error=job.error, finished=job.finished, file=job.file
+    )
+
+
+def requeue_stale_jobs() -> int:
+    """Re-queue running jobs whose worker appears to have died. Returns the number re-queued.
+    Re-running an import is safe, since imports skip duplicates."""
+    cutoff = timezone.now() - timedelta(seconds=STALE_JOB_TIMEOUT)
+
+    return sum(
+        model.objects.filter(
+            status=JobStatus.RUNNING.value, heartbeat__lt=cutoff
+        ).update(status=JobStatus.QUEUED.value, started=None, heartbeat=None)
+        for model in JOB_MODELS
+    )
+
+
+def prune_finished_jobs() -> int:
+    """Delete old finished jobs. Returns the number deleted."""
+    cutoff = timezone.now() - timedelta(seconds=FINISHED_JOB_RETENTION)
+
+    count = 0
+    for model in JOB_MODELS:
+        deleted, _ = (
+            model.objects.exclude(status__in=PENDING)
+            .filter(finished__lt=cutoff)
+            .delete()
+        )
+        count += deleted
+
+    return count
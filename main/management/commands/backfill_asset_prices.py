@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import asset_prices, util
+from main.asset_prices import CryptoType
+from main.models import Person, SubAccount
+
+
+class Command(BaseCommand):
+    help = (
+        "Load daily asset prices into the price history, and optionally revalue snapshots of "
+        "asset accounts from it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="Number of days of history to load, ending today.",
+        )
+        parser.add_argument(
+            "--asset",
+            action="append",
+            choices=[asset.name for asset in CryptoType],
+            help="Only load this asset. May be repeated.",
+        )
+        parser.add_argument(
+            "--revalue",
+            action="store_true",
+            help="Afterwards, revalue asset account and net worth snapshots from the history.",
+        )
+        parser.add_argument(
+            "--person", type=int, help="Only revalue the person with this ID."
+        )
+
+    def handle(self, *args, **options):
+        if options["asset"]:
+            assets = [CryptoType[name] for name in options["asset"]]
+        else:
+            assets = list(CryptoType)
+
+        end = timezone.localdate()
+        start = end - timedelta(days=options["days"] - 1)
+
+        count = asset_prices.backfill_daily_prices(assets, start, end)
+        self.stdout.write(f"Saved {count} daily prices from {start} to {end}")
+
+        if not options["revalue"]:
+            return
+
+        # Only people with asset accounts have snapshots to revalue.
+        people = Person.objects.filter(
+            id__in=SubAccount.objects.filter(asset_type__isnull=False).values("owner")
+        ).order_by("id")
+        if options["person"] is not None:
+            people = people.filter(id=options["person"])
+
+        for person in people.iterator():
+            count = util.revalue_asset_snapshots(person)
+            self.stdout.write(f"{person}: {count} snapshots revalued")
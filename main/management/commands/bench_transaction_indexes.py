@@ -0,0 +1,165 @@
+"""
+Times, and on Postgres, shows query plans for, our hot-path transaction queries. To compare them with
+and without the indexes on `Transaction` (see its `Meta.indexes`), on Postgres:
+
+python manage.py bench_transaction_indexes
+python manage.py bench_transaction_indexes --skip-generate --without-indexes
+
+`--without-indexes` drops those indexes, restoring plain foreign key indexes in their place, and
+rolls this back when done. The table is locked meanwhile, so don't run it against a live database.
+"""
+
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Index
+from django.utils import timezone
+
+from main import synthetic, util
+from main.models import Person, Transaction
+from main.views import TRANSACTIONS_PAGE_SIZE
+
+BENCH_USERNAME = "bench_transaction_indexes@example.com"
+
+
+class Command(BaseCommand):
+    help = "Benchmark hot-path transaction queries against a large synthetic data set."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1_000_000,
+            help="Number of synthetic transactions to generate.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--accounts", type=int, default=5, help="Linked accounts to generate."
+        )
+        parser.add_argument(
+            "--skip-generate",
+            action="store_true",
+            help="Re-use data generated by a previous run.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs of each query; we report the fastest.",
+        )
+        parser.add_argument(
+            "--without-indexes",
+            action="store_true",
+            help="Drop the indexes on transactions while benchmarking. Postgres only.",
+        )
+
+    def handle(self, *args, **options):
+        if options["without_indexes"] and connection.vendor != "postgresql":
+            # SQLite can't change schemas in a transaction we roll back.
+            raise CommandError("--without-indexes requires Postgres.")
+
+        rng = random.Random(options["seed"])
+
+        person = Person.objects.filter(user__username=BENCH_USERNAME).first()
+
+        if not options["skip_generate"]:
+            if person is not None:
+                # Cascades to the person, and their accounts and transactions.
+                person.user.delete()
+
+            person = synthetic.create_person(BENCH_USERNAME)
+            accounts = synthetic.create_accounts(person, options["accounts"], rng)
+
+            start = time.perf_counter()
+            count = synthetic.create_transactions(
+                person, accounts, options["rows"], rng
+            )
+            self.stdout.write(
+                f"Generated {count} transactions in {time.perf_counter() - start:.1f}s"
+            )
+
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE main_transaction")
+
+        elif person is None:
+            self.stderr.write("No benchmark data; run without --skip-generate first.")
+            return
+
+        account = person.accounts.first()
+        today = timezone.localdate()
+        month_start = today.replace(day=1)
+
+        sample = (
+            Transaction.objects.filter(account=account)
+            .exclude(plaid_id__isnull=True)
+            .order_by("id")
+            .first()
+        )
+
+        queries = {
+            "Dashboard transactions (first page)": util.load_transactions(
+                0, TRANSACTIONS_PAGE_SIZE, person, None, None, None, None
+            ),
+            "Transactions, 90-day range": util.load_transactions(
+                None, None, person, None, today - timedelta(days=90), today, None
+            ),
+            "Account transactions by date": Transaction.objects.filter(
+                account=account, date__gte=today - timedelta(days=30)
+            ).order_by("-date", "-id"),
+            "Person's transactions by date": Transaction.objects.filter(
+                owner=person
+            ).order_by("-date", "-id")[:TRANSACTIONS_PAGE_SIZE],
+            "Sync lookup by Plaid ID": Transaction.objects.filter(
+                plaid_id=sample.plaid_id if sample else ""
+            ),
+            "Rule match by description": Transaction.objects.filter(
+                owner=person, description_norm=sample.description_norm if sample else ""
+            ),
+            "Spending, this month": util.load_transactions_spending(
+                person, month_start, today
+            ),
+        }
+
+        if not options["without_indexes"]:
+            self.run_queries(queries, options["repeat"])
+            return
+
+        with transaction.atomic():
+            with connection.schema_editor() as editor:
+                for index in Transaction._meta.indexes:
+                    editor.remove_index(Transaction, index)
+
+                # The indexes replaced these.
+                for field in ["account", "person", "owner"]:
+                    editor.add_index(
+                        Transaction,
+                        Index(fields=[field], name=f"bench_tran_{field}_idx"),
+                    )
+
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE main_transaction")
+
+            self.run_queries(queries, options["repeat"])
+
+            # Restore the indexes.
+            transaction.set_rollback(True)
+
+    def run_queries(self, queries: dict, repeat: int):
+        for name, qs in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+
+            if connection.vendor == "postgresql":
+                self.stdout.write(qs.explain(analyze=True, buffers=True))
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                len(list(qs.all()))  # `all()` clones, so we don't hit the result cache.
+                timings.append(time.perf_counter() - start)
+
+            self.stdout.write(f"Best of {repeat}: {min(timings) * 1000:.2f}ms")
@@ -0,0 +1,73 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic person with linked accounts, transactions, rules, a budget, and "
+        "snapshots. Output is deterministic for a given seed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", default="synthetic@example.com")
+        parser.add_argument(
+            "--transactions",
+            type=int,
+            default=10_000,
+            help="Number of transactions to generate; eg 1,000 to 1,000,000.",
+        )
+        parser.add_argument(
+            "--accounts",
+            type=int,
+            default=3,
+            help=f"Linked accounts to generate; at most {len(synthetic.INSTITUTIONS)}.",
+        )
+        parser.add_argument(
+            "--snapshot-days",
+            type=int,
+            default=365,
+            help="Days of daily value snapshots to generate.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Delete the user, and their data, if they already exist.",
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options["accounts"] <= len(synthetic.INSTITUTIONS):
+            raise CommandError(
+                f"--accounts must be between 1 and {len(synthetic.INSTITUTIONS)}."
+            )
+
+        user = User.objects.filter(username=options["username"]).first()
+        if user is not None:
+            if not options["replace"]:
+                raise CommandError(
+                    f"{options['username']} already exists; pass --replace to regenerate."
+                )
+            # Cascades to the person, and their data.
+            user.delete()
+
+        start = time.perf_counter()
+
+        person = synthetic.create_person_with_data(
+            options["username"],
+            options["transactions"],
+            options["accounts"],
+            random.Random(options["seed"]),
+            snapshot_days=options["snapshot_days"],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {person.transactions.count()} transactions for {person} in "
+                f"{time.perf_counter() - start:.1f}s"
+            )
+        )
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from main import rollups
+from main.models import Person
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or with --check, verify) the monthly category rollup from transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--person", type=int, help="Only process the person with this ID."
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Report discrepancies between the rollup and transactions, without writing.",
+        )
+
+    def handle(self, *args, **options):
+        people = Person.objects.select_related("user").order_by("id")
+        if options["person"] is not None:
+            people = people.filter(id=options["person"])
+
+        num_mismatched = 0
+
+        for person in people.iterator():
+            if options["check"]:
+                problems = rollups.check_monthly_totals(person)
+                if problems:
+                    num_mismatched += 1
+                    self.stdout.write(f"{person}: {len(problems)} discrepancies")
+                    for problem in problems:
+                        self.stdout.write(f"    {problem}")
+            else:
+                count = rollups.rebuild_monthly_totals(person)
+                self.stdout.write(f"{person}: {count} rollup rows")
+
+        if options["check"]:
+            if num_mismatched:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"{num_mismatched} people have rollup discrepancies."
+                    )
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS("Rollups are consistent."))
@@ -0,0 +1,182 @@
+"""
+Times core data-loading paths against a synthetic person, and reports the results as JSON, for
+comparing commits. Eg:
+
+python manage.py run_benchmarks --transactions 100000 --label baseline --output before.json
+python manage.py run_benchmarks --skip-generate --label my-change --output after.json
+"""
+
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+from io import StringIO
+from typing import Callable, Dict, Optional
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from main import asset_prices, export, synthetic, util
+from main.models import Person
+from main.views import TRANSACTIONS_PAGE_SIZE
+
+BENCH_USERNAME = "run_benchmarks@example.com"
+# Imports run into a separate person, recreated for each run, so every run inserts all rows.
+IMPORT_USERNAME = "run_benchmarks_import@example.com"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark core views' data loading against synthetic data, with JSON output."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--transactions",
+            type=int,
+            default=100_000,
+            help="Number of synthetic transactions to generate.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--skip-generate",
+            action="store_true",
+            help="Re-use data generated by a previous run.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs of each benchmark; we report the fastest, and the median.",
+        )
+        parser.add_argument(
+            "--import-rows",
+            type=int,
+            default=5_000,
+            help="Rows in the CSV file used for the import benchmark.",
+        )
+        parser.add_argument(
+            "--label", default="", help="Included in the output, eg a commit hash."
+        )
+        parser.add_argument(
+            "--output", help="Write results to this file, vice standard output."
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        # Keep network latency out of the timings; the synthetic person holds crypto.
+        asset_prices.provider = asset_prices.StaticProvider()
+
+        if not options["skip_generate"]:
+            # Cascades to the person, and their data.
+            User.objects.filter(username=BENCH_USERNAME).delete()
+
+            start = time.perf_counter()
+            person = synthetic.create_person_with_data(
+                BENCH_USERNAME, options["transactions"], 3, rng
+            )
+            self.stderr.write(
+                f"Generated synthetic data in {time.perf_counter() - start:.1f}s"
+            )
+        else:
+            person = Person.objects.filter(user__username=BENCH_USERNAME).first()
+            if person is None:
+                raise CommandError(
+                    "No benchmark data; run without --skip-generate first."
+                )
+
+        csv_data = synthetic.mint_csv(options["import_rows"], rng)
+
+        today = timezone.localdate()
+        month_ago = today - timedelta(days=30)
+        year_ago = today - timedelta(days=365)
+
+        def import_setup() -> Person:
+            User.objects.filter(username=IMPORT_USERNAME).delete()
+            return synthetic.create_person(IMPORT_USERNAME)
+
+        benchmarks = {
+            "load_transactions": lambda: list(
+                util.load_transactions(
+                    0, TRANSACTIONS_PAGE_SIZE, person, None, None, None, None
+                )
+            ),
+            "load_transactions (search)": lambda: list(
+                util.load_transactions(
+                    0, TRANSACTIONS_PAGE_SIZE, person, "starbucks", None, None, None
+                )
+            ),
+            "setup_spending_data": lambda: util.setup_spending_data(person, 30, 0),
+            "setup_spending_highlights": lambda: util.setup_spending_highlights(
+                person, 30, 0, False
+            ),
+            # Invalidate the cache before each run, so we time loading the data.
+            "load_dash_data": (
+                lambda: util.load_dash_data(person),
+                lambda: util.data_changed(person),
+            ),
+            "import_csv_mint": (
+                lambda p: export.import_csv_mint(StringIO(csv_data), p),
+                import_setup,
+            ),
+            "export_csv": lambda: sum(1 for _ in export.export_csv(person)),
+            "find_new_merchants": lambda: util.find_new_merchants(
+                person, (month_ago, today), (year_ago, month_ago)
+            ),
+        }
+
+        results = {}
+        for name, bench in benchmarks.items():
+            fn, setup = bench if isinstance(bench, tuple) else (bench, None)
+
+            results[name] = run_benchmark(fn, setup, options["repeat"])
+            self.stderr.write(
+                f"{name}: {results[name]['min_ms']:.2f}ms, {results[name]['queries']} queries"
+            )
+
+        User.objects.filter(username=IMPORT_USERNAME).delete()
+
+        output = json.dumps(
+            {
+                "label": options["label"],
+                "database": connection.vendor,
+                "transactions": person.transactions.count(),
+                "repeat": options["repeat"],
+                "results": results,
+            },
+            indent=2,
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+
+def run_benchmark(fn: Callable, setup: Optional[Callable], repeat: int) -> Dict:
+    """Time a function. If `setup` is passed, it runs, untimed, before each run; its result, if any,
+    is passed to `fn`. Queries are counted on a separate run, since capturing them adds overhead.
+    """
+
+    def run_once() -> float:
+        arg = setup() if setup is not None else None
+
+        start = time.perf_counter()
+        fn(arg) if arg is not None else fn()
+        return time.perf_counter() - start
+
+    timings = [run_once() for _ in range(repeat)]
+
+    with CaptureQueriesContext(connection) as queries:
+        run_once()
+
+    return {
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "queries": len(queries.captured_queries),
+    }
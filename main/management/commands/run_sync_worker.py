@@ -0,0 +1,59 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued Plaid account syncs and CSV imports. Runs until stopped, unless --once is "
+        "passed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty, vice waiting for new jobs.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between checks of an empty queue.",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+
+        # Finish the current job on shutdown (eg a dyno restart), vice abandoning it mid-sync.
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write("Worker started.")
+
+        while not self.stopping:
+            # Drop connections the database has closed, eg after a restart, as Django does per request.
+            close_old_connections()
+
+            job = jobs.claim_next_job()
+
+            if job is None:
+                jobs.requeue_stale_jobs()
+                jobs.prune_finished_jobs()
+
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"Running {job}")
+            jobs.run_job(job)
+
+        self.stdout.write("Worker stopped.")
+
+    def stop(self, signum, frame):
+        self.stopping = True
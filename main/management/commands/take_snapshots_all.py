@@ -0,0 +1,86 @@
+"""
+Saves a daily value snapshot of every person's accounts, and net worth, including people who haven't
+loaded the dashboard recently. Run it on a schedule, eg daily with Heroku Scheduler:
+
+python manage.py take_snapshots_all
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from main import util
+from main.models import Person, SubAccount
+
+
+class Command(BaseCommand):
+    help = "Snapshot all people's account values and net worth, in parallel batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help="Worker processes. With 1, runs in this process.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="People per batch.",
+        )
+
+    def handle(self, *args, **options):
+        person_ids = list(
+            Person.objects.filter(sub_accounts__isnull=False)
+            .distinct()
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        size = options["chunk_size"]
+        chunks = [person_ids[i : i + size] for i in range(0, len(person_ids), size)]
+
+        count = 0
+        failed = 0
+
+        if options["processes"] <= 1:
+            for chunk in chunks:
+                count += snapshot_chunk(chunk)
+        else:
+            # Forked workers would otherwise share this process's database connections.
+            connections.close_all()
+
+            # Fork, so workers inherit the configured Django setup, vice re-importing it.
+            with ProcessPoolExecutor(
+                max_workers=options["processes"],
+                mp_context=multiprocessing.get_context("fork"),
+            ) as executor:
+                futures = {
+                    executor.submit(snapshot_chunk, chunk): chunk for chunk in chunks
+                }
+
+                for future in as_completed(futures):
+                    try:
+                        count += future.result()
+                    except Exception as e:
+                        chunk = futures[future]
+                        self.stderr.write(
+                            f"Error snapshotting people {chunk[0]} to {chunk[-1]}: {e}"
+                        )
+                        failed += len(chunk)
+
+        if failed:
+            raise CommandError(
+                f"Snapshotted {count} people; {failed} failed, and will be retried next run."
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted {count} people."))
+
+
+def snapshot_chunk(person_ids: List[int]) -> int:
+    """Snapshot a batch of people. Returns the number snapshotted."""
+    return util.save_snapshots(SubAccount.objects.filter(owner_id__in=person_ids))
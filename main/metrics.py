@@ -0,0 +1,203 @@
+"""
+Per-view request metrics: wall time, database query count and time, and response size. These are
+kept in in-process histograms, and exposed in Prometheus's text format by the `metrics` view. Note
+that with multiple server processes, each reports only the requests it handled.
+"""
+
+import hmac
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+
+from wallet.settings import METRICS_TOKEN
+
+# Requests slower than this are candidates for logging, with their queries.
+SLOW_REQUEST_THRESHOLD = 1.0  # seconds
+# The fraction of slow requests logged, so a slow endpoint under load doesn't flood the log.
+SLOW_REQUEST_SAMPLE_RATE = 0.1
+# The most queries included in a slow request's log entry; the slowest are shown.
+SLOW_REQUEST_MAX_QUERIES = 10
+
+# Histogram bucket upper bounds.
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+SIZE_BUCKETS = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+
+class Histogram:
+    """A Prometheus-style histogram: cumulative counts by bucket, along with a sum and count."""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+        self.sum += value
+        self.count += 1
+
+
+# (Metric name, help text, buckets)
+METRICS = [
+    (
+        "http_request_duration_seconds",
+        "Wall time spent handling requests.",
+        DURATION_BUCKETS,
+    ),
+    ("http_request_db_queries", "Database queries per request.", QUERY_COUNT_BUCKETS),
+    (
+        "http_request_db_duration_seconds",
+        "Time spent in database queries per request.",
+        DURATION_BUCKETS,
+    ),
+    (
+        "http_response_size_bytes",
+        "Response body sizes. Streaming responses aren't included.",
+        SIZE_BUCKETS,
+    ),
+]
+
+# { (metric name, view, method, status class): Histogram }
+_histograms: Dict[Tuple[str, str, str, str], Histogram] = {}
+_lock = threading.Lock()
+
+
+def observe(name: str, labels: Tuple[str, str, str], value: float):
+    buckets = next(b for n, _, b in METRICS if n == name)
+
+    with _lock:
+        hist = _histograms.get((name, *labels))
+        if hist is None:
+            hist = _histograms[(name, *labels)] = Histogram(buckets)
+
+        hist.observe(value)
+
+
+class QueryRecorder:
+    """A database execute wrapper that records the time of each query run during a request."""
+
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+
+class MetricsMiddleware:
+    """Record metrics for each request, labeled by the view that handled it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        duration = time.perf_counter() - start
+
+        view = view_name(request)
+        labels = (view, request.method, f"{response.status_code // 100}xx")
+        db_time = sum(t for _, t in recorder.queries)
+
+        observe("http_request_duration_seconds", labels, duration)
+        observe("http_request_db_queries", labels, len(recorder.queries))
+        observe("http_request_db_duration_seconds", labels, db_time)
+        if not response.streaming:
+            observe("http_response_size_bytes", labels, len(response.content))
+
+        if (
+            duration > SLOW_REQUEST_THRESHOLD
+            and random.random() < SLOW_REQUEST_SAMPLE_RATE
+        ):
+            log_slow_request(request, view, duration, db_time, recorder.queries)
+
+        return response
+
+
+def view_name(request: HttpRequest) -> str:
+    """The name of the view function that handled a request, eg "dashboard"."""
+    match = request.resolver_match
+    if match is None:
+        return "unmatched"
+
+    return match.view_name.rsplit(".", 1)[-1]
+
+
+def log_slow_request(
+    request: HttpRequest,
+    view: str,
+    duration: float,
+    db_time: float,
+    queries: List[Tuple[str, float]],
+):
+    print(
+        f"\nSlow request: {request.method} {request.path} ({view}): {duration:.3f}s, "
+        f"{len(queries)} queries taking {db_time:.3f}s"
+    )
+
+    for sql, t in sorted(queries, key=lambda q: q[1], reverse=True)[
+        :SLOW_REQUEST_MAX_QUERIES
+    ]:
+        print(f"    {t * 1000:.1f}ms: {sql[:300]}")
+
+
+def render_metrics() -> str:
+    """Export all histograms in Prometheus's text format."""
+    with _lock:
+        histograms = {
+            k: (list(h.counts), h.sum, h.count) for k, h in _histograms.items()
+        }
+
+    lines = []
+    for name, help_text, buckets in METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+
+        for (name_, view, method, status), (counts, sum_, count) in sorted(
+            histograms.items()
+        ):
+            if name_ != name:
+                continue
+
+            labels = f'view="{view}",method="{method}",status="{status}"'
+
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {sum_}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    """The Prometheus scrape endpoint. Requires the `METRICS_TOKEN` as a bearer token, or a staff
+    login."""
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        authorized = True
+
+    if not authorized:
+        return HttpResponse(status=404)
+
+    return HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,92 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0065_alter_categorycustom_name_alter_institution_plaid_id_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyCategoryTotal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField()),
+                (
+                    "category",
+                    models.IntegerField(
+                        choices=[
+                            (-1, "UNCATEGORIZED"),
+                            (2, "SOFTWARE_SUBSCRIPTIONS"),
+                            (0, "GROCERIES"),
+                            (1, "RESTAURANTS"),
+                            (3, "TRAVEL"),
+                            (4, "AIRLINES_AND_AVIATION_SERVICES"),
+                            (5, "RECREATION"),
+                            (6, "GYMS_AND_FITNESS_CENTERS"),
+                            (7, "TRANSFER"),
+                            (8, "DEPOSIT"),
+                            (9, "INCOME"),
+                            (10, "CREDIT_CARD"),
+                            (11, "FAST_FOOD"),
+                            (12, "DEBIT"),
+                            (13, "SHOPS"),
+                            (14, "PAYMENT"),
+                            (15, "COFFEE_SHOP"),
+                            (16, "TAXI"),
+                            (17, "SPORTING_GOODS"),
+                            (18, "ELECTRONICS"),
+                            (19, "PETS"),
+                            (20, "CHILDREN"),
+                            (21, "MORTGAGE_AND_RENT"),
+                            (22, "CAR"),
+                            (23, "HOME_AND_GARDEN"),
+                            (24, "MEDICAL"),
+                            (25, "ENTERTAINMENT"),
+                            (26, "BILLS_AND_UTILITIES"),
+                            (27, "INVESTMENTS"),
+                            (28, "FEES"),
+                            (29, "TAXES"),
+                            (30, "BUSINESS_SERVICES"),
+                            (31, "CASH_AND_CHECKS"),
+                            (32, "GIFTS"),
+                            (33, "EDUCATION"),
+                            (34, "ALCOHOL"),
+                            (35, "HEALTH_AND_PERSONAL_CARE"),
+                            (36, "CLOTHING"),
+                            (37, "WITHDRAWAL"),
+                        ]
+                    ),
+                ),
+                ("ignored", models.BooleanField(default=False)),
+                ("spending", models.BooleanField()),
+                ("income", models.BooleanField()),
+                ("total", models.FloatField()),
+                ("count", models.IntegerField()),
+                (
+                    "person",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="monthly_totals",
+                        to="main.person",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["month"],
+                "unique_together": {("person", "month", "category", "ignored")},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:46
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+# Trigram indexes are Postgres-only; on other databases (eg SQLite in development), search
+# uses the same query, without an index.
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS main_transaction_search_trgm "
+        "ON main_transaction USING gin (search_text gin_trgm_ops)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("DROP INDEX IF EXISTS main_transaction_search_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0066_monthlycategorytotal"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="search_text",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.functions.text.Lower(
+                    django.db.models.functions.text.Concat(
+                        "description",
+                        models.Value("\n"),
+                        "notes",
+                        models.Value("\n"),
+                        "institution_name",
+                        models.Value("\n"),
+                        "merchant",
+                        output_field=models.TextField(),
+                    )
+                ),
+                output_field=models.TextField(),
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:48
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0067_transaction_search_text"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["account", "-date", "-id"], name="tran_account_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["person", "-date", "-id"], name="tran_person_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(("plaid_id__isnull", False)),
+                fields=["plaid_id"],
+                name="tran_plaid_id_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                django.db.models.functions.text.Upper("description"),
+                name="tran_description_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(("ignored", False)),
+                fields=["category", "date"],
+                name="tran_spend_cat_date_idx",
+            ),
+        ),
+        # Drop the single-column foreign key indexes once the composite indexes covering them exist.
+        migrations.AlterField(
+            model_name="transaction",
+            name="account",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="transactions",
+                to="main.financialaccount",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="person",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="transactions_without_account",
+                to="main.person",
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def populate_owner(apps, schema_editor):
+    """Set `owner` from the linked account's person, or for manual and imported rows, from `person`."""
+    FinancialAccount = apps.get_model("main", "FinancialAccount")
+    SubAccount = apps.get_model("main", "SubAccount")
+    Transaction = apps.get_model("main", "Transaction")
+
+    account_person = Subquery(
+        FinancialAccount.objects.filter(id=OuterRef("account_id")).values("person_id")[
+            :1
+        ]
+    )
+
+    for model in [Transaction, SubAccount]:
+        model.objects.filter(account__isnull=False).update(owner=account_person)
+        model.objects.filter(account__isnull=True).update(owner=F("person"))
+
+        # Rows with neither an account, nor a person (eg left behind by a deleted user) aren't
+        # visible to anyone, and can't be given an owner.
+        model.objects.filter(owner__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0068_transaction_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="subaccount",
+            name="owner",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="sub_accounts",
+                to="main.person",
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="owner",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="transactions",
+                to="main.person",
+            ),
+        ),
+        migrations.RunPython(populate_owner, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# This is separate from populating `owner`, since Postgres doesn't allow altering a table with
+# pending foreign key checks from the same transaction.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0069_owner"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="subaccount",
+            name="owner",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="sub_accounts",
+                to="main.person",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="owner",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="transactions",
+                to="main.person",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["owner", "-date", "-id"], name="tran_owner_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+BATCH_SIZE = 5_000
+
+
+def normalize_description(descrip: str) -> str:
+    """A frozen copy of `transaction_cats.normalize_description`, as of this migration, so later
+    changes to it don't change what this migration does."""
+    # Remove apostrophes, as in "McDonald's".
+    return descrip.lower().strip().replace("'", "").replace("&", "").replace(" ", "")
+
+
+def populate_description_norm(apps, schema_editor):
+    """Set `description_norm` on existing transactions and rules, in batches."""
+    for model_name in ["Transaction", "CategoryRule"]:
+        model = apps.get_model("main", model_name)
+
+        batch = []
+        for obj in model.objects.only("id", "description").iterator(
+            chunk_size=BATCH_SIZE
+        ):
+            obj.description_norm = normalize_description(obj.description)
+            batch.append(obj)
+
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ["description_norm"])
+                batch = []
+
+        model.objects.bulk_update(batch, ["description_norm"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0072_person_rules_version"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="tran_description_upper_idx",
+        ),
+        migrations.AddField(
+            model_name="categoryrule",
+            name="description_norm",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="description_norm",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(populate_description_norm, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="categoryrule",
+            index=models.Index(
+                fields=["person", "description_norm"], name="rule_person_descrip_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["owner", "description_norm"], name="tran_owner_descrip_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0073_description_norm"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.IntegerField(
+                        choices=[
+                            (0, "QUEUED"),
+                            (1, "RUNNING"),
+                            (2, "DONE"),
+                            (3, "FAILED"),
+                        ],
+                        db_index=True,
+                        default=0,
+                    ),
+                ),
+                ("created", models.DateTimeField()),
+                ("started", models.DateTimeField(blank=True, null=True)),
+                ("finished", models.DateTimeField(blank=True, null=True)),
+                ("file", models.BinaryField(blank=True, default=b"")),
+                ("rows_processed", models.IntegerField(default=0)),
+                ("inserted", models.IntegerField(default=0)),
+                ("skipped", models.IntegerField(default=0)),
+                ("malformed", models.IntegerField(default=0)),
+                ("error", models.TextField(blank=True, default="")),
+                (
+                    "person",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="import_jobs",
+                        to="main.person",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created"],
+            },
+        ),
+    ]
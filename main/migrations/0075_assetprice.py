@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0074_importjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AssetPrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "asset_type",
+                    models.IntegerField(
+                        choices=[
+                            (0, "Bitcoin"),
+                            (1, "Ethereum"),
+                            (2, "Bnb"),
+                            (3, "Solana"),
+                            (4, "Xrp"),
+                        ],
+                        unique=True,
+                    ),
+                ),
+                ("price", models.FloatField(default=0)),
+                ("updated", models.DateTimeField()),
+                ("refresh_started", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0075_assetprice"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AssetPriceDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "asset_type",
+                    models.IntegerField(
+                        choices=[
+                            (0, "Bitcoin"),
+                            (1, "Ethereum"),
+                            (2, "Bnb"),
+                            (3, "Solana"),
+                            (4, "Xrp"),
+                        ]
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("price", models.FloatField()),
+            ],
+            options={
+                "unique_together": {("asset_type", "date")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0076_assetpricedaily"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="person",
+            name="data_version",
+            field=models.IntegerField(default=0),
+        ),
+    ]
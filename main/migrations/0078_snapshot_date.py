@@ -0,0 +1,84 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:12
+
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 5_000
+
+
+def populate_date_and_dedupe(apps, schema_editor):
+    """Set `date` on existing snapshots, keeping only the latest for each account or person on each
+    day, in batches."""
+    for model_name, key in [
+        ("SnapshotAccount", "account_id"),
+        ("SnapshotPerson", "person_id"),
+    ]:
+        model = apps.get_model("main", model_name)
+
+        seen = set()
+        to_update = []
+        to_delete = []
+
+        for obj in (
+            model.objects.only("id", key, "dt")
+            .order_by(key, "-dt", "-id")
+            .iterator(chunk_size=BATCH_SIZE)
+        ):
+            obj.date = timezone.localdate(obj.dt)
+            owner = getattr(obj, key)
+
+            # Snapshots of deleted accounts don't conflict.
+            if owner is not None and (owner, obj.date) in seen:
+                to_delete.append(obj.id)
+            else:
+                seen.add((owner, obj.date))
+                to_update.append(obj)
+
+            if len(to_update) >= BATCH_SIZE:
+                model.objects.bulk_update(to_update, ["date"])
+                to_update = []
+            if len(to_delete) >= BATCH_SIZE:
+                model.objects.filter(id__in=to_delete).delete()
+                to_delete = []
+
+        model.objects.bulk_update(to_update, ["date"])
+        model.objects.filter(id__in=to_delete).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0077_person_data_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="snapshotaccount",
+            name="date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="snapshotperson",
+            name="date",
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(populate_date_and_dedupe, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="snapshotaccount",
+            name="date",
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name="snapshotperson",
+            name="date",
+            field=models.DateField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name="snapshotaccount",
+            unique_together={("account", "date")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="snapshotperson",
+            unique_together={("person", "date")},
+        ),
+    ]
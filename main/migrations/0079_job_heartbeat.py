@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 21:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+RUNNING = 1  # `JobStatus.RUNNING`
+
+
+def set_heartbeats(apps, schema_editor):
+    """Give running jobs a heartbeat, so they're re-queued if their worker died."""
+    for model_name in ["SyncJob", "ImportJob"]:
+        model = apps.get_model("main", model_name)
+        model.objects.filter(status=RUNNING).update(heartbeat=F("started"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0078_snapshot_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="heartbeat",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="syncjob",
+            name="heartbeat",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_heartbeats, migrations.RunPython.noop),
+    ]
@@ -14,6 +14,7 @@ from django.contrib.auth.tokens import default_token_generator
 from django.db.models import (
     SET_NULL,
     CASCADE,
+    BinaryField,
     IntegerField,
     DateField,
     DateTimeField,
@@ -23,10 +24,15 @@ from django.db.models import (
     Model,
     BooleanField,
     ForeignKey,
+    GeneratedField,
+    Value,
+    Index,
+    Q,
 )
+from django.db.models.functions import Concat, Lower
 
 from main.asset_prices import CryptoType
-from main.transaction_cats import TransactionCategory
+from main.transaction_cats import TransactionCategory, normalize_description
 
 
 def enum_choices(cls):
@@ -40,12 +46,31 @@ def enum_choices(cls):
     return cls
 
 
+def set_description_norm(instance: Model, save_kwargs: dict):
+    """Update `description_norm` from `description`, before saving. If saving specific fields
+    (eg from `update_or_create`) that include the description, includes the normalized one.
+    """
+    instance.description_norm = normalize_description(instance.description)
+
+    update_fields = save_kwargs.get("update_fields")
+    if update_fields is not None and "description" in update_fields:
+        save_kwargs["update_fields"] = {*update_fields, "description_norm"}
+
+
 @enum_choices
 class RecurringDirection(Enum):
     INFLOW = 0
     OUTFLOW = 1
 
 
+@enum_choices
+class JobStatus(Enum):
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+
+
 @enum_choices
 class SubAccountType(Enum):
     """These are types as reported by Plaid, with some exception"""
@@ -175,6 +200,10 @@ class Person(Model):
     # We use this token to verify the user's email address. We set it to null once the email is verified.
     email_verification_token = CharField(max_length=200, blank=True, null=True)
     date_registered = DateTimeField()
+    # Incremented when the person's category rules change; keys their cached `RuleMatcher`.
+    rules_version = IntegerField(default=0)
+    # Incremented when the person's accounts or transactions change; keys their cached dashboard data.
+    data_version = IntegerField(default=0)
 
     def __str__(self):
         return f"Person. id: {self.id} User: {self.user.username}"
@@ -309,6 +338,9 @@ class SubAccount(Model):
         blank=True,
         on_delete=SET_NULL,
     )
+    # Whose account this is, whether linked or manual. This duplicates `account.person` or `person`, so
+    # we can filter by person without a join.
+    owner = ForeignKey(Person, related_name="sub_accounts", on_delete=CASCADE)
     plaid_id = CharField(max_length=100, blank=True, null=True)
     plaid_id_persistent = CharField(max_length=100, blank=True, null=True)
     name = CharField(max_length=200)
@@ -331,6 +363,11 @@ class SubAccount(Model):
 
     def get_value(self) -> float:
         if self.asset_type is not None:
+            # Set by `asset_prices.prefetch_prices`, when loading many sub-accounts.
+            price = getattr(self, "asset_price", None)
+            if price is not None:
+                return price * self.asset_quantity
+
             return CryptoType(self.asset_type).account_value(self.asset_quantity)
         else:
             return self.current
@@ -404,6 +441,7 @@ class Transaction(Model):
         null=True,
         blank=True,
         on_delete=SET_NULL,
+        db_index=False,  # Covered by `tran_account_date_idx`.
     )
     # We use Person for imports, and manually-added transactions.
     person = ForeignKey(
@@ -412,6 +450,16 @@ class Transaction(Model):
         null=True,
         blank=True,
         on_delete=SET_NULL,
+        db_index=False,  # Covered by `tran_person_date_idx`.
+    )
+    # Whose transaction this is; always set. This duplicates `account.person` or `person`, so we can
+    # filter by person without a join, from a single index. Note that `delete_accounts` reassigns
+    # transactions from `account` to `person`; `owner` doesn't change.
+    owner = ForeignKey(
+        Person,
+        related_name="transactions",
+        on_delete=CASCADE,
+        db_index=False,  # Covered by `tran_owner_date_idx`.
     )
     institution_name = CharField(
         max_length=100
@@ -424,6 +472,9 @@ class Transaction(Model):
     category = IntegerField(choices=TransactionCategory.choices())
     amount = FloatField()
     description = TextField()
+    # `description`, normalized for matching against category rules. Set on save; bulk operations
+    # must set it explicitly. See `transaction_cats.normalize_description`.
+    description_norm = TextField(default="", blank=True)
     date = DateField()  # It appears we don't have datetimes available from plaid
     # Datetime seems generally missing from Plaid, despite it being more useful.
     datetime = DateTimeField(null=True, blank=True)
@@ -441,6 +492,25 @@ class Transaction(Model):
     highlighted = BooleanField(default=False)
     # Hidden from stats, but shown in the table.
     ignored = BooleanField(default=False)
+    # The text fields we search, lowercased, and separated by newlines so matches don't span fields.
+    # Maintained by the database. On Postgres, a trigram index on this serves substring search;
+    # see migration 0067.
+    search_text = GeneratedField(
+        expression=Lower(
+            Concat(
+                "description",
+                Value("\n"),
+                "notes",
+                Value("\n"),
+                "institution_name",
+                Value("\n"),
+                "merchant",
+                output_field=TextField(),
+            )
+        ),
+        output_field=TextField(),
+        db_persist=True,
+    )
 
     def serialize(self) -> Dict[str, str]:
         """For use in the web page."""
@@ -490,6 +560,10 @@ class Transaction(Model):
             "ignored": self.ignored,
         }
 
+    def save(self, *args, **kwargs):
+        set_description_norm(self, kwargs)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Transaction. Id: {self.id}, {self.description}, {self.institution_name}, Amount: {self.amount}, date: {self.date}"
 
@@ -503,6 +577,28 @@ class Transaction(Model):
             ["date", "description", "amount", "account"],
             ["date", "description", "amount", "person"],
         ]
+        # These cover our hot paths. The date-ordered indexes serve loading an account's, or person's
+        # transactions in date ranges, and keyset pagination; they replace the foreign key indexes.
+        # Run the `bench_transaction_indexes` command to compare query plans.
+        indexes = [
+            Index(fields=["owner", "-date", "-id"], name="tran_owner_date_idx"),
+            Index(fields=["account", "-date", "-id"], name="tran_account_date_idx"),
+            Index(fields=["person", "-date", "-id"], name="tran_person_date_idx"),
+            # Applying sync modifications and removals.
+            Index(
+                fields=["plaid_id"],
+                name="tran_plaid_id_idx",
+                condition=Q(plaid_id__isnull=False),
+            ),
+            # Applying category rules to existing transactions.
+            Index(fields=["owner", "description_norm"], name="tran_owner_descrip_idx"),
+            # Spending by category over a date range, eg budgets. Ignored transactions are excluded from these.
+            Index(
+                fields=["category", "date"],
+                name="tran_spend_cat_date_idx",
+                condition=Q(ignored=False),
+            ),
+        ]
 
 
 class SnapshotAccount(Model):
@@ -512,8 +608,13 @@ class SnapshotAccount(Model):
     # Used if the account gets deleted etc.
     account_name = CharField(max_length=200)
     dt = DateTimeField()
+    # The day of `dt`. We keep one snapshot per account per day; later ones that day replace it.
+    date = DateField()
     value = FloatField()
 
+    class Meta:
+        unique_together = ["account", "date"]
+
     def __str__(self):
         return f"Value snapshot. {self.account}, {self.dt}: {self.value}"
 
@@ -521,8 +622,13 @@ class SnapshotAccount(Model):
 class SnapshotPerson(Model):
     person = ForeignKey(Person, related_name="snapshots", on_delete=CASCADE)
     dt = DateTimeField()
+    # The day of `dt`. We keep one snapshot per person per day; later ones that day replace it.
+    date = DateField()
     value = FloatField()
 
+    class Meta:
+        unique_together = ["person", "date"]
+
     def __str__(self):
         return f"Value snapshot. {self.person}, {self.dt}: {self.value}"
 
@@ -614,11 +720,20 @@ class CategoryRule(Model):
 
     person = ForeignKey(Person, related_name="category_rules", on_delete=CASCADE)
     description = CharField(max_length=100)
+    # `description`, normalized for matching against transactions. Set on save.
+    description_norm = CharField(max_length=100, default="", blank=True)
     category = IntegerField(choices=TransactionCategory.choices())
 
     class Meta:
         ordering = ["description"]
         unique_together = ["person", "description"]
+        indexes = [
+            Index(fields=["person", "description_norm"], name="rule_person_descrip_idx")
+        ]
+
+    def save(self, *args, **kwargs):
+        set_description_norm(self, kwargs)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Category rule. Person: {self.person}, {self.description} => {self.category}"
@@ -639,3 +754,114 @@ class BudgetItem(Model):
 
     def __str__(self):
         return f"Budget item. Person: {self.person}, {self.category}, {self.notes}, {self.amount}"
+
+
+class MonthlyCategoryTotal(Model):
+    """A rollup of a person's transactions, by calendar month and category. This is kept current
+    on each transaction write, so monthly reports don't need to scan transactions. See `rollups.py`.
+    """
+
+    person = ForeignKey(Person, related_name="monthly_totals", on_delete=CASCADE)
+    month = DateField()  # The first day of the month.
+    category = IntegerField(choices=TransactionCategory.choices())
+    # Ignored transactions are rolled up separately from non-ignored ones.
+    ignored = BooleanField(default=False)
+    # These are derived from category and ignored, for filtering.
+    spending = BooleanField()
+    income = BooleanField()
+    total = FloatField()
+    count = IntegerField()
+
+    class Meta:
+        ordering = ["month"]
+        unique_together = ["person", "month", "category", "ignored"]
+
+    def __str__(self):
+        return f"Monthly total. Person: {self.person}, {self.month}, {self.category}, {self.total} ({self.count})"
+
+
+class SyncJob(Model):
+    """A queued refresh of a person's linked accounts from Plaid. The dashboard enqueues these, and the
+    `run_sync_worker` command processes them, so web requests don't wait on Plaid. See `jobs.py`.
+    """
+
+    person = ForeignKey(Person, related_name="sync_jobs", on_delete=CASCADE)
+    status = IntegerField(
+        choices=JobStatus.choices(), default=JobStatus.QUEUED.value, db_index=True
+    )
+    created = DateTimeField()
+    started = DateTimeField(blank=True, null=True)
+    # Updated by the worker as it makes progress. A running job whose heartbeat is old is assumed
+    # to belong to a worker that died.
+    heartbeat = DateTimeField(blank=True, null=True)
+    finished = DateTimeField(blank=True, null=True)
+    # Set if the sync loaded new balances or transactions.
+    new_data = BooleanField(default=False)
+    error = TextField(default="", blank=True)
+
+    class Meta:
+        ordering = ["created"]
+
+    def __str__(self):
+        return f"Sync job. Person: {self.person}, {JobStatus(self.status).name}, created: {self.created}"
+
+
+class ImportJob(Model):
+    """A queued import of an uploaded Mint CSV file. The settings page enqueues these, and
+    `run_sync_worker` processes them in batches, updating the counts below as it goes. See `jobs.py`.
+    """
+
+    person = ForeignKey(Person, related_name="import_jobs", on_delete=CASCADE)
+    status = IntegerField(
+        choices=JobStatus.choices(), default=JobStatus.QUEUED.value, db_index=True
+    )
+    created = DateTimeField()
+    started = DateTimeField(blank=True, null=True)
+    # Updated by the worker as it makes progress. A running job whose heartbeat is old is assumed
+    # to belong to a worker that died.
+    heartbeat = DateTimeField(blank=True, null=True)
+    finished = DateTimeField(blank=True, null=True)
+    # The uploaded file. Cleared once the import finishes.
+    file = BinaryField(default=b"", blank=True)
+    rows_processed = IntegerField(default=0)
+    inserted = IntegerField(default=0)
+    skipped = IntegerField(default=0)
+    malformed = IntegerField(default=0)
+    error = TextField(default="", blank=True)
+
+    class Meta:
+        ordering = ["created"]
+
+    def __str__(self):
+        return f"Import job. Person: {self.person}, {JobStatus(self.status).name}, created: {self.created}"
+
+
+class AssetPrice(Model):
+    """The latest unit price of an asset, in USD. This is shared by all processes, vice each keeping
+    its own cache, and is refreshed in the background; see `asset_prices.unit_price`."""
+
+    asset_type = IntegerField(choices=CryptoType.choices(), unique=True)
+    price = FloatField(default=0)
+    updated = DateTimeField()
+    # Set while a process refreshes this price, so others don't fetch it concurrently.
+    refresh_started = DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Asset price. {CryptoType(self.asset_type).name}: {self.price}, updated: {self.updated}"
+
+
+class AssetPriceDaily(Model):
+    """An asset's closing price, in USD, on a given day. Used to value holdings in the past, eg when
+    revaluing snapshots, without making API calls. See `asset_prices.backfill_daily_prices`.
+    """
+
+    asset_type = IntegerField(choices=CryptoType.choices())
+    date = DateField()
+    price = FloatField()
+
+    class Meta:
+        # This also serves range queries for an asset's prices.
+        unique_together = ["asset_type", "date"]
+
+    def __str__(self):
+        return f"Daily asset price. {CryptoType(self.asset_type).name}, {self.date}: {self.price}"
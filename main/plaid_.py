@@ -5,7 +5,9 @@ Sandbox test credentials: user_good, pass_good, credential_good (pin), mfa_devic
 """
 
 import json
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime
 from typing import Optional, Iterable, List
 
 from django.db.models import Q
@@ -28,9 +30,9 @@ from plaid.model.transactions_recurring_get_request import (
     TransactionsRecurringGetRequest,
 )
 from plaid.model.transactions_sync_request import TransactionsSyncRequest
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
 
-from . import util
+from . import util, rollups
 from .models import (
     FinancialAccount,
     SubAccount,
@@ -40,8 +42,14 @@ from .models import (
     RecurringTransaction,
     RecurringDirection,
 )
-from .transaction_cats import TransactionCategory
-from wallet.settings import PLAID_SECRET, PLAID_CLIENT_ID, PLAID_MODE, PlaidMode
+from .transaction_cats import RuleMatcher, TransactionCategory, normalize_description
+from wallet.settings import (
+    PLAID_SECRET,
+    PLAID_CLIENT_ID,
+    PLAID_MODE,
+    PlaidMode,
+    PLAID_SYNC_CONCURRENCY,
+)
 
 import plaid
 from plaid.api import plaid_api
@@ -53,6 +61,12 @@ TRAN_REFRESH_INTERVAL = 4 * 24 * HOUR  # seconds.
 # We can use a slow update for recurring transactions.
 ACCOUNT_REFRESH_INTERVAL_RECURRING = 10 * 24 * HOUR  # seconds.
 
+# Rows per query when saving synced transactions.
+BULK_BATCH_SIZE = 1_000
+
+# Longer merchant names would fail the insert, on Postgres.
+MERCHANT_MAX_LEN = Transaction._meta.get_field("merchant").max_length
+
 
 # Note: We don't use assets! That's used to qualify for a loan. Transactions only appears to work.
 PRODUCTS = [Products(p) for p in ["transactions"]]
@@ -122,22 +136,46 @@ def update_accounts(accounts: Iterable[FinancialAccount]) -> bool:
 
     util.send_debug_email(f"Updating accounts for accounts: {accounts}")  # todo temp
 
-    for acc in accounts:
-        if (
-            now - acc.last_tran_refresh_attempt
-        ).total_seconds() > TRAN_REFRESH_INTERVAL:
-            print(f"Refreshing account: {acc}...")
-            acc.last_tran_refresh_attempt = now
-            acc.save()
-            success = refresh_transactions(acc)
-
-            if success:
-                acc.last_tran_refresh_success = now
-                new_data = True
-
-
-            acc.save()
+    accounts_due = [
+        acc
+        for acc in accounts
+        if (now - acc.last_tran_refresh_attempt).total_seconds() > TRAN_REFRESH_INTERVAL
+    ]
+
+    for acc in accounts_due:
+        print(f"Refreshing account: {acc}...")
+        acc.last_tran_refresh_attempt = now
+        acc.save()
+
+    # Fetch from each institution concurrently; this is network-bound. We apply results to the
+    # database here, one account at a time, as each finishes.
+    if accounts_due:
+        with ThreadPoolExecutor(
+            max_workers=min(PLAID_SYNC_CONCURRENCY, len(accounts_due))
+        ) as executor:
+            futures = {
+                executor.submit(_fetch_in_thread, acc): acc for acc in accounts_due
+            }
+
+            for future in as_completed(futures):
+                acc = futures[future]
+
+                # A failure, fetching or saving, only affects this account; the rest still refresh.
+                try:
+                    updates = future.result()
+                    apply_transaction_updates(acc, updates)
+                    acc.last_tran_refresh_success = now
+                    new_data = True
+                except ApiException as e:
+                    handle_api_exception(e, acc)
+                except Exception as e:
+                    msg = f"Error refreshing transactions for {acc}: {e}"
+                    print(msg)
+                    util.send_debug_email(msg)
+
+                acc.save()
 
+    for acc in accounts:
         if (
             now - acc.last_refreshed_recurring
         ).total_seconds() > ACCOUNT_REFRESH_INTERVAL_RECURRING:
@@ -150,6 +188,15 @@ def update_accounts(accounts: Iterable[FinancialAccount]) -> bool:
     return new_data
 
 
+def refresh_due(account: FinancialAccount, now: datetime) -> bool:
+    """Returns `True` if `update_accounts` would refresh anything for this account."""
+    return (
+        now - account.last_tran_refresh_attempt
+    ).total_seconds() > TRAN_REFRESH_INTERVAL or (
+        now - account.last_refreshed_recurring
+    ).total_seconds() > ACCOUNT_REFRESH_INTERVAL_RECURRING
+
+
 # todo: Delegate to these A/R
 def refresh_non_investment(account: FinancialAccount) -> bool:
     """Returns error status"""
@@ -200,6 +247,17 @@ def refresh_investment(account: FinancialAccount) -> List[dict]:
     #     investment_transactions.extend(response["transactions"])
 
 
+@dataclass
+class TransactionUpdates:
+    """Changes reported by Plaid since an account's cursor."""
+
+    cursor: str
+    sub_accs: list
+    added: list
+    modified: list
+    removed: list  # Removed transaction ids
+
+
 def refresh_transactions(account: FinancialAccount) -> bool:
     """
     Updates the database with transaction and account balance data for a single institutions accounts.
@@ -212,6 +270,20 @@ def refresh_transactions(account: FinancialAccount) -> bool:
     """
     # util.send_debug_email(f"Refreshing transactions for account: {account}")  # todo temp
 
+    try:
+        updates = fetch_transaction_updates(account)
+    except ApiException as e:
+        handle_api_exception(e, account)
+        return False
+
+    apply_transaction_updates(account, updates)
+
+    return True
+
+
+def fetch_transaction_updates(account: FinancialAccount) -> TransactionUpdates:
+    """Load transaction and account balance changes from Plaid. This makes network requests only; no
+    database queries, so it's safe to run concurrently for multiple accounts."""
     # Provide a cursor from your database if you've previously
     # received one for the Item. Leave null if this is your first sync call for this Item. The first request will
     # return a cursor. (It seems None doesn't work with this API, but an empty string does.)
@@ -231,11 +303,7 @@ def refresh_transactions(account: FinancialAccount) -> bool:
             cursor=cursor,
         )
 
-        try:
-            response = CLIENT.transactions_sync(request)
-        except ApiException as e:
-            handle_api_exception(e, account)
-            return False
+        response = CLIENT.transactions_sync(request)
 
         # # todo: This is temp/debug
         # print(f"\n\nRESPONSE from : {account.institution}", response, "\n\n")
@@ -251,37 +319,83 @@ def refresh_transactions(account: FinancialAccount) -> bool:
         # Update cursor to the next cursor
         cursor = response["next_cursor"]
 
-    # Persist cursor and updated data
-    # database.apply_updates(item_id, added, modified, removed, cursor)
-    rules = account.person.category_rules.all()
-
     # todo: This is sloppy. Figure out the proper way to handle transactions/sync not working
     # todo for investment accounts.
     # todo: FOr example, is there a way to check the account type?
     if len(sub_accs) == 0 and not account.plaid_cursor:
         sub_accs = refresh_investment(account)
 
-    for sub in sub_accs:
-        print(f"\n\n Updating or adding acc from sync: {sub}\n\n")
+    return TransactionUpdates(cursor, sub_accs, added, modified, removed)
 
-        try:
-            sub_acc_model, _ = SubAccount.objects.update_or_create(
-                account=account,
-                plaid_id=sub.account_id,
-                defaults={
-                    "plaid_id_persistent": "",  # todo temp?
-                    "name": sub.name,
-                    "name_official": sub.official_name,
-                    "type": AccountType.from_str(str(sub.type)).value,
-                    "sub_type": SubAccountType.from_str(str(sub.subtype)).value,
-                    "iso_currency_code": sub.balances.iso_currency_code,
-                    "available": sub.balances.available,
-                    "current": sub.balances.current,
-                    "limit": sub.balances.limit,
-                },
-            )
-        except IntegrityError:
-            print(f"\nThis subaccount already exists: {sub}")
+
+def _fetch_in_thread(account: FinancialAccount) -> TransactionUpdates:
+    """Run `fetch_transaction_updates` from a worker thread."""
+    try:
+        return fetch_transaction_updates(account)
+    finally:
+        # Django opens a separate database connection per thread, eg if a related model is loaded
+        # lazily; make sure it's not left open.
+        connection.close()
+
+
+def apply_transaction_updates(
+    account: FinancialAccount, updates: TransactionUpdates
+) -> None:
+    """Save changes loaded from Plaid to the database."""
+    sub_accs = updates.sub_accs
+    added = updates.added
+    modified = updates.modified
+    removed = updates.removed
+    cursor = updates.cursor
+
+    # Persist cursor and updated data
+    # database.apply_updates(item_id, added, modified, removed, cursor)
+    rules = util.rule_matcher(account.person)
+
+    # Apply all updates in one transaction, so a failure part way leaves neither partial data, nor
+    # an advanced cursor.
+    with transaction.atomic():
+        for sub in sub_accs:
+            print(f"\n\n Updating or adding acc from sync: {sub}\n\n")
+
+            try:
+                sub_acc_model, _ = SubAccount.objects.update_or_create(
+                    account=account,
+                    plaid_id=sub.account_id,
+                    defaults={
+                        "owner": account.person,
+                        "plaid_id_persistent": "",  # todo temp?
+                        "name": sub.name,
+                        "name_official": sub.official_name,
+                        "type": AccountType.from_str(str(sub.type)).value,
+                        "sub_type": SubAccountType.from_str(str(sub.subtype)).value,
+                        "iso_currency_code": sub.balances.iso_currency_code,
+                        "available": sub.balances.available,
+                        "current": sub.balances.current,
+                        "limit": sub.balances.limit,
+                    },
+                )
+            except IntegrityError:
+                print(f"\nThis subaccount already exists: {sub}")
+
+        # Dates of transactions added, modified, or removed, for updating monthly rollups.
+        dates_touched = []
+
+        dates_touched.extend(add_transactions(account, added, rules))
+        dates_touched.extend(modify_transactions(account, modified))
+        dates_touched.extend(remove_transactions(account, removed))
+
+        rollups.refresh_monthly_totals(account.person, dates_touched)
+
+        account.plaid_cursor = cursor
+        account.save()
+
+
+def add_transactions(
+    account: FinancialAccount, added: list, rules: RuleMatcher
+) -> List[date]:
+    """Save transactions added by a sync, in one query. Returns their dates."""
+    trans_db = []
 
     for tran in added:
         # print("\n\n Adding transaction: ", tran, "\n\n")
@@ -292,78 +406,143 @@ def refresh_transactions(account: FinancialAccount) -> bool:
             f"\n Description: {tran.name}, Cat prim: {cat_primary}, Cat detailed: {cat_detailed} Cat isolated: {tran.category}\n"
         )
 
-        tran_db = Transaction(
-            account=account,
-            institution_name=account.institution.name,
-            category=TransactionCategory.from_plaid(
-                tran.category, tran.name, rules
-            ).value,
-            # todo: Sort out what pos vs negative transactions mean, here and import
-            amount=-tran.amount,
-            # Note: Other fields like "merchant_name" are available, but aren't used on many transactcions.
-            description=tran.name,
-            merchant=tran.merchant_name,  # Not always present.
-            date=tran.date,
-            datetime=tran.datetime,
-            plaid_id=tran.transaction_id,
-            currency_code=tran.iso_currency_code,
-            pending=tran.pending,
-            logo_url=tran.logo_url,
-            plaid_category_icon_url="",  # todo: A/R
+        trans_db.append(
+            Transaction(
+                account=account,
+                owner=account.person,
+                institution_name=account.institution.name,
+                category=TransactionCategory.from_plaid(
+                    tran.category, tran.name, rules, cat_detailed
+                ).value,
+                # todo: Sort out what pos vs negative transactions mean, here and import
+                amount=-tran.amount,
+                # Note: Other fields like "merchant_name" are available, but aren't used on many transactcions.
+                description=tran.name,
+                description_norm=normalize_description(tran.name),
+                # Plaid often omits this; our column isn't nullable, and a null would fail the
+                # whole batch.
+                merchant=(tran.merchant_name or "")[:MERCHANT_MAX_LEN],
+                date=tran.date,
+                datetime=tran.datetime,
+                plaid_id=tran.transaction_id,
+                # Null for currencies without an ISO code, eg some crypto.
+                currency_code=tran.iso_currency_code or "",
+                pending=tran.pending,
+                logo_url=tran.logo_url,
+                plaid_category_icon_url="",  # todo: A/R
+            )
         )
-        try:
-            tran_db.save()
-        except IntegrityError:
-            # todo: Why do we get this, if using cursor?
-            print("Integrity error when saving a transaction: ", account)
+
+    # Conflicts (eg a transaction we already have; todo: Why do we get these, if using cursor?) are
+    # skipped, as saving individually and catching `IntegrityError` did.
+    Transaction.objects.bulk_create(
+        trans_db, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True
+    )
+
+    return [t.date for t in trans_db]
+
+
+# Fields a sync modification can change.
+MODIFIED_FIELDS = [
+    "amount",
+    "description",
+    "description_norm",
+    "date",
+    "datetime",
+    "currency_code",
+    "pending",
+    "logo_url",
+    "plaid_category_icon_url",
+]
+
+
+def modify_transactions(account: FinancialAccount, modified: list) -> List[date]:
+    """Apply modifications from a sync, with one query to find the transactions, and one to update
+    them. Returns dates touched, before and after the modification."""
+    if not modified:
+        return []
 
     # On Pending: https://plaid.com/docs/transactions/transactions-data/
     # Pending transactions will be in the remove category once completed, and the
     # final transaction wil be added; so, they are not modifications.
+    ids = [tran.transaction_id for tran in modified]
+    ids_pending = [
+        tran.pending_transaction_id for tran in modified if tran.pending_transaction_id
+    ]
+
+    by_plaid_id = {}
+    for tran_db in Transaction.objects.filter(
+        # account=account,
+        Q(plaid_id__in=ids)
+        | Q(plaid_id__in=ids_pending) & Q(account=account),
+    ):
+        by_plaid_id[tran_db.plaid_id] = tran_db
+
+    dates_touched = []
+    trans_db = []
+
     for tran in modified:
-        tran_db = Transaction.objects.filter(
-            # account=account,
-            Q(plaid_id=tran.transaction_id)
-            | Q(plaid_id=tran.pending_transaction_id) & Q(account=account),
+        tran_db = by_plaid_id.get(tran.transaction_id) or by_plaid_id.get(
+            tran.pending_transaction_id
         )
 
-        try:
-            tran_db = tran_db[0]
-        except IndexError as e:
+        if tran_db is None:
             print(
                 f"\n Error: Unable to find the transaction requested to modify: \n\n{tran}"
             )
-            util.send_debug_email(f"Tran modification error: \n{tran}: \n\n: {e}")
-        else:
-            tran_db.amount = tran.amount
-            tran_db.description = tran.name
-            tran_db.date = tran.date
-            tran_db.datetime = tran.datetime
-            tran_db.currency_code = tran.iso_currency_code
-            tran_db.pending = tran.pending
-            tran_db.logo_url = tran.logo_url
-            tran_db.plaid_category_icon_url = ""
+            util.send_debug_email(f"Tran modification error: \n{tran}")
+            continue
+
+        dates_touched.extend([tran_db.date, tran.date])
 
+        tran_db.amount = tran.amount
+        tran_db.description = tran.name
+        tran_db.description_norm = normalize_description(tran.name)
+        tran_db.date = tran.date
+        tran_db.datetime = tran.datetime
+        tran_db.currency_code = tran.iso_currency_code or ""
+        tran_db.pending = tran.pending
+        tran_db.logo_url = tran.logo_url
+        tran_db.plaid_category_icon_url = ""
+
+        trans_db.append(tran_db)
+
+    try:
+        with transaction.atomic():
+            Transaction.objects.bulk_update(
+                trans_db, MODIFIED_FIELDS, batch_size=BULK_BATCH_SIZE
+            )
+    except IntegrityError:
+        # A modification conflicts with an existing transaction. Save individually, so we only skip
+        # the conflicting ones.
+        for tran_db in trans_db:
             try:
-                tran_db.save()
+                with transaction.atomic():
+                    tran_db.save(update_fields=MODIFIED_FIELDS)
             except IntegrityError as e:
                 print(f"\n\nIntegrity error saving message\n\n: {tran_db}: \n: {e}")
                 util.send_debug_email(
                     f"Integrity error saving message\n\n: {tran_db}: \n: {e}"
                 )
 
-    for tran in removed:
-        _ = Transaction.objects.filter(
-            # account=account,
-            # Q(plaid_id=tran.transaction_id) | Q(plaid_id=tran.pending_transaction_id) & Q(account=account),
-            plaid_id=tran.transaction_id,
-            account=account,
-        ).delete()
+    return dates_touched
 
-    account.plaid_cursor = cursor
-    account.save()
 
-    return True
+def remove_transactions(account: FinancialAccount, removed: list) -> List[date]:
+    """Delete transactions removed by a sync, in one query. Returns their dates."""
+    if not removed:
+        return []
+
+    trans_removed = Transaction.objects.filter(
+        # account=account,
+        # Q(plaid_id=tran.transaction_id) | Q(plaid_id=tran.pending_transaction_id) & Q(account=account),
+        plaid_id__in=[tran.transaction_id for tran in removed],
+        account=account,
+    )
+    dates_touched = list(trans_removed.values_list("date", flat=True))
+    trans_removed.delete()
+
+    return dates_touched
 
 
 def refresh_recurring(account: FinancialAccount):
@@ -457,7 +636,7 @@ def refresh_recurring(account: FinancialAccount):
     #                       'transaction_ids': ['dLaL3XVNJ4HpkwzW733ZtBZQPx6QQaiJ5PPNk',
     #                                           'Ko9oNdQyV8UnpLD5AJJgcE7ZxeGZZWsRW668p',
     #                                           'APbPkV3497TgKnNZQookfXJm35nRQqt955P44']},
-    rules = account.person.category_rules.all()
+    rules = util.rule_matcher(account.person)
 
     for recur in inflow_streams:
         sub_acc = SubAccount.objects.get(plaid_id=recur.account_id)
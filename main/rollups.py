@@ -0,0 +1,130 @@
+"""
+Maintains `MonthlyCategoryTotal`: Per-person transaction totals and counts, by month and category.
+
+Each path that writes transactions collects the months it touched, and calls `refresh_monthly_totals`,
+which recomputes only those months from the transactions table. Reports like spending over time and
+the budget then read a few dozen rollup rows, instead of scanning a person's full history.
+"""
+
+from datetime import date
+from typing import Iterable, List, Optional, Set
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncMonth
+
+from main import transaction_cats
+from main.models import MonthlyCategoryTotal, Person, Transaction
+from main.transaction_cats import TransactionCategory
+
+# Rollup totals that differ from transactions by more than this are reported by `check_monthly_totals`.
+CHECK_TOLERANCE = 0.005
+
+
+def month_of(d: date) -> date:
+    """The first day of the month containing a date. Accepts ISO strings, eg from the frontend."""
+    if isinstance(d, str):
+        d = date.fromisoformat(d)
+    return d.replace(day=1)
+
+
+def _compute_totals(
+    person: Person, months: Optional[Set[date]]
+) -> List[MonthlyCategoryTotal]:
+    """Aggregate transactions into (unsaved) rollup rows. If `months` is None, compute all months."""
+    trans = Transaction.objects.filter(owner=person)
+
+    if months is not None:
+        # A date range lets the database use its date indexes; the month filter below handles gaps.
+        trans = trans.filter(
+            date__gte=min(months), date__lt=max(months) + relativedelta(months=1)
+        )
+
+    rows = (
+        trans.annotate(month=TruncMonth("date"))
+        .values("month", "category", "ignored")
+        .order_by()
+        .annotate(total=Sum("amount"), count=Count("id"))
+    )
+
+    result = []
+    for row in rows:
+        if months is not None and row["month"] not in months:
+            continue
+
+        result.append(
+            MonthlyCategoryTotal(
+                person=person,
+                month=row["month"],
+                category=row["category"],
+                ignored=row["ignored"],
+                spending=transaction_cats.is_spending(row["category"], row["ignored"]),
+                income=row["category"] == TransactionCategory.INCOME.value,
+                total=row["total"],
+                count=row["count"],
+            )
+        )
+
+    return result
+
+
+def _lock_person(person: Person) -> None:
+    """Serialize rollup writes for a person, eg from a sync job and an edit at once. Without this,
+    concurrent refreshes of the same month both delete, then both insert, and one fails the unique
+    constraint. Call this in a transaction."""
+    Person.objects.select_for_update().filter(id=person.id).first()
+
+
+def refresh_monthly_totals(person: Person, dates: Iterable[date]) -> None:
+    """Recompute the rollup for the months containing these dates. Call this after adding, editing,
+    or deleting transactions, with both their previous and new dates."""
+    months = {month_of(d) for d in dates if d is not None}
+    if not months:
+        return
+
+    with transaction.atomic():
+        _lock_person(person)
+
+        MonthlyCategoryTotal.objects.filter(person=person, month__in=months).delete()
+        MonthlyCategoryTotal.objects.bulk_create(_compute_totals(person, months))
+
+
+def rebuild_monthly_totals(person: Person) -> int:
+    """Recompute the entire rollup for a person, eg for backfilling. Returns the number of rows."""
+    with transaction.atomic():
+        _lock_person(person)
+
+        totals = _compute_totals(person, None)
+        MonthlyCategoryTotal.objects.filter(person=person).delete()
+        MonthlyCategoryTotal.objects.bulk_create(totals)
+
+    return len(totals)
+
+
+def check_monthly_totals(person: Person) -> List[str]:
+    """Compare a person's rollup against their transactions, without modifying it. Returns a
+    description of each discrepancy."""
+    expected = {
+        (t.month, t.category, t.ignored): t for t in _compute_totals(person, None)
+    }
+    actual = {
+        (t.month, t.category, t.ignored): t
+        for t in MonthlyCategoryTotal.objects.filter(person=person)
+    }
+
+    result = []
+    for key in sorted(expected.keys() | actual.keys()):
+        exp = expected.get(key)
+        act = actual.get(key)
+
+        if exp is None:
+            result.append(f"{key}: Unexpected rollup row: {act.total} ({act.count})")
+        elif act is None:
+            result.append(f"{key}: Missing rollup row: {exp.total} ({exp.count})")
+        elif exp.count != act.count or abs(exp.total - act.total) > CHECK_TOLERANCE:
+            result.append(
+                f"{key}: Rollup has {act.total} ({act.count}); transactions have {exp.total} ({exp.count})"
+            )
+
+    return result
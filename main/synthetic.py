@@ -0,0 +1,381 @@
+"""
+Generates synthetic people, accounts, transactions, and related data, for benchmarks and query plan
+analysis. Output is deterministic for a given random seed.
+"""
+
+import csv
+import random
+from datetime import date, datetime, timedelta
+from io import StringIO
+from typing import List
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from main import rollups
+from main.asset_prices import CryptoType
+from main.models import (
+    AccountType,
+    BudgetItem,
+    CategoryRule,
+    FinancialAccount,
+    Institution,
+    Person,
+    SnapshotAccount,
+    SnapshotPerson,
+    SubAccount,
+    SubAccountType,
+    Transaction,
+)
+from main.transaction_cats import TransactionCategory, normalize_description
+
+# Descriptions, categories, and typical amounts of transactions we generate.
+MERCHANTS = [
+    ("Starbucks", TransactionCategory.COFFEE_SHOP, 6.0),
+    ("Trader Joe's", TransactionCategory.GROCERIES, 70.0),
+    ("Whole Foods", TransactionCategory.GROCERIES, 90.0),
+    ("Shell", TransactionCategory.CAR, 45.0),
+    ("Uber", TransactionCategory.TAXI, 22.0),
+    ("Chipotle", TransactionCategory.FAST_FOOD, 14.0),
+    ("Olive Garden", TransactionCategory.RESTAURANTS, 60.0),
+    ("Amazon", TransactionCategory.SHOPS, 40.0),
+    ("Best Buy", TransactionCategory.ELECTRONICS, 180.0),
+    ("Netflix", TransactionCategory.SOFTWARE_SUBSCRIPTIONS, 15.0),
+    ("Github", TransactionCategory.BUSINESS_SERVICES, 10.0),
+    ("Planet Fitness", TransactionCategory.GYMS_AND_FITNESS_CENTERS, 25.0),
+    ("Dominion Energy", TransactionCategory.BILLS_AND_UTILITIES, 120.0),
+    ("Verizon", TransactionCategory.BILLS_AND_UTILITIES, 85.0),
+    ("United Airlines", TransactionCategory.AIRLINES_AND_AVIATION_SERVICES, 420.0),
+    ("Marriott", TransactionCategory.TRAVEL, 250.0),
+    ("CVS", TransactionCategory.HEALTH_AND_PERSONAL_CARE, 25.0),
+    ("Petco", TransactionCategory.PETS, 45.0),
+    ("Old Navy", TransactionCategory.CLOTHING, 55.0),
+    ("Home Depot", TransactionCategory.HOME_AND_GARDEN, 110.0),
+    ("Rent payment", TransactionCategory.MORTGAGE_AND_RENT, 1900.0),
+    ("Credit card payment", TransactionCategory.CREDIT_CARD, 1200.0),
+    ("Transfer to savings", TransactionCategory.TRANSFER, 500.0),
+]
+
+# Deposits; these are positive amounts.
+INCOME_SOURCES = [
+    ("Payroll direct deposit", TransactionCategory.INCOME, 2800.0),
+    ("Interest payment", TransactionCategory.INCOME, 4.0),
+]
+
+INSTITUTIONS = ["Chase", "Capital One", "American Express", "Ally", "Fidelity"]
+
+# Sub-accounts of each linked account: Name, type, sub-type, and typical balance.
+SUB_ACCOUNTS = [
+    ("Checking", AccountType.DEPOSITORY, SubAccountType.CHECKING, 4_000.0),
+    ("Savings", AccountType.DEPOSITORY, SubAccountType.SAVINGS, 15_000.0),
+    ("Credit card", AccountType.CREDIT, SubAccountType.CREDIT_CARD, 1_500.0),
+    ("Brokerage", AccountType.INVESTMENT, SubAccountType.BROKERAGE, 40_000.0),
+]
+
+
+def create_person(username: str) -> Person:
+    """Create a verified person, and their user, for synthetic data."""
+    user = User.objects.create(username=username, email=username)
+
+    return Person.objects.create(
+        user=user,
+        email_verified=True,
+        date_registered=timezone.now(),
+    )
+
+
+def create_accounts(
+    person: Person, num_accounts: int, rng: random.Random
+) -> List[FinancialAccount]:
+    """Create linked (institution-level) accounts for a person."""
+    long_ago = timezone.make_aware(datetime(1999, 9, 9))
+
+    result = []
+    for i in range(num_accounts):
+        name = INSTITUTIONS[i % len(INSTITUTIONS)]
+
+        inst, _ = Institution.objects.get_or_create(
+            plaid_id=f"synthetic_{name.lower().replace(' ', '_')}",
+            defaults={"name": name},
+        )
+
+        result.append(
+            FinancialAccount.objects.create(
+                person=person,
+                institution=inst,
+                name="",
+                access_token=f"synthetic-{person.id}-{i}-{rng.getrandbits(64):x}",
+                item_id=f"synthetic-item-{person.id}-{i}",
+                last_tran_refresh_attempt=long_ago,
+                last_tran_refresh_success=long_ago,
+                last_refreshed_recurring=long_ago,
+            )
+        )
+
+    return result
+
+
+def create_sub_accounts(
+    person: Person,
+    accounts: List[FinancialAccount],
+    per_account: int,
+    rng: random.Random,
+) -> List[SubAccount]:
+    """Create sub-accounts for each linked account, and a manual crypto account."""
+    result = []
+    for acc in accounts:
+        for name, type_, sub_type, typical in SUB_ACCOUNTS[:per_account]:
+            result.append(
+                SubAccount(
+                    account=acc,
+                    owner=person,
+                    plaid_id=f"{rng.getrandbits(128):032x}",
+                    name=name,
+                    type=type_.value,
+                    sub_type=sub_type.value,
+                    iso_currency_code="USD",
+                    current=round(typical * rng.uniform(0.2, 2.0), 2),
+                )
+            )
+
+    result.append(
+        SubAccount(
+            person=person,
+            owner=person,
+            name="Crypto",
+            type=AccountType.INVESTMENT.value,
+            sub_type=SubAccountType.CRYPTO.value,
+            iso_currency_code="USD",
+            asset_type=rng.choice(list(CryptoType)).value,
+            asset_quantity=round(rng.uniform(0.1, 5.0), 4),
+        )
+    )
+
+    return SubAccount.objects.bulk_create(result)
+
+
+def create_rules(person: Person, count: int, rng: random.Random) -> List[CategoryRule]:
+    """Create category rules matching generated merchant descriptions."""
+    merchants = rng.sample(MERCHANTS, min(count, len(MERCHANTS)))
+
+    return [
+        CategoryRule.objects.create(
+            person=person, description=description.upper(), category=category.value
+        )
+        for description, category, _ in merchants
+    ]
+
+
+def create_budget_items(person: Person, rng: random.Random) -> List[BudgetItem]:
+    """Create a budget item for each category we generate spending in."""
+    categories = {category: typical for _, category, typical in MERCHANTS}
+
+    return BudgetItem.objects.bulk_create(
+        [
+            BudgetItem(
+                person=person,
+                category=category.value,
+                amount=round(typical * rng.uniform(2.0, 8.0), 2),
+            )
+            for category, typical in categories.items()
+        ]
+    )
+
+
+def create_snapshots(
+    person: Person, sub_accounts: List[SubAccount], days: int, rng: random.Random
+) -> int:
+    """Create a daily value snapshot for each sub-account, and the person's net worth, over the past
+    `days` days. Values are drawn from a slow random walk. Returns the number of person snapshots.
+    """
+    now = timezone.now()
+
+    snaps_account = []
+    snaps_person = []
+
+    for day in range(days):
+        dt = now - timedelta(days=days - day)
+        net_worth = 0.0
+
+        for sub_acc in sub_accounts:
+            value = sub_acc.current * (1.0 + 0.3 * (day - days) / days)
+            value *= rng.uniform(0.97, 1.03)
+
+            snaps_account.append(
+                SnapshotAccount(
+                    account=sub_acc,
+                    account_name=sub_acc.name,
+                    dt=dt,
+                    date=timezone.localdate(dt),
+                    value=value,
+                )
+            )
+
+            if sub_acc.type in [AccountType.LOAN.value, AccountType.CREDIT.value]:
+                net_worth -= value
+            else:
+                net_worth += value
+
+        snaps_person.append(
+            SnapshotPerson(
+                person=person, dt=dt, date=timezone.localdate(dt), value=net_worth
+            )
+        )
+
+    SnapshotAccount.objects.bulk_create(snaps_account, batch_size=10_000)
+    SnapshotPerson.objects.bulk_create(snaps_person, batch_size=10_000)
+
+    return len(snaps_person)
+
+
+def create_person_with_data(
+    username: str,
+    num_transactions: int,
+    num_accounts: int,
+    rng: random.Random,
+    snapshot_days: int = 365,
+) -> Person:
+    """Create a person with linked accounts, sub-accounts, transactions, rules, a budget, and
+    snapshots, as a long-time user would have. Rebuilds their monthly rollup."""
+    person = create_person(username)
+
+    # Snapshots get their own generator, seeded before anything else is drawn, so the number of
+    # snapshot days doesn't change the other generated data, and vice versa.
+    snapshot_rng = random.Random(rng.getrandbits(64))
+
+    accounts = create_accounts(person, num_accounts, rng)
+    sub_accounts = create_sub_accounts(person, accounts, 3, rng)
+
+    create_transactions(person, accounts, num_transactions, rng)
+    create_rules(person, 8, rng)
+    create_budget_items(person, rng)
+    create_snapshots(person, sub_accounts, snapshot_days, snapshot_rng)
+
+    rollups.rebuild_monthly_totals(person)
+
+    return person
+
+
+def mint_csv(count: int, rng: random.Random, days: int = 10 * 365) -> str:
+    """Generate a Mint-format CSV export, for import benchmarks."""
+    today = timezone.localdate()
+
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(
+        [
+            "Date",
+            "Description",
+            "Original Description",
+            "Amount",
+            "Transaction Type",
+            "Category",
+            "Account Name",
+            "Labels",
+            "Notes",
+        ]
+    )
+
+    for _ in range(count):
+        if rng.random() < 0.04:
+            description, category, typical = rng.choice(INCOME_SOURCES)
+            type_ = "credit"
+        else:
+            description, category, typical = rng.choice(MERCHANTS)
+            type_ = "debit"
+
+        date_ = today - timedelta(days=rng.randrange(days))
+
+        writer.writerow(
+            [
+                date_.strftime("%m/%d/%Y"),
+                f"{description} #{rng.randint(1, 9999)}",
+                "",
+                round(typical * rng.uniform(0.5, 1.5), 2),
+                type_,
+                category.to_str(),
+                rng.choice(INSTITUTIONS),
+                "",
+                "",
+            ]
+        )
+
+    return output.getvalue()
+
+
+def make_transaction(
+    person: Person,
+    accounts: List[FinancialAccount],
+    date_: date,
+    rng: random.Random,
+) -> Transaction:
+    """Create an unsaved transaction. Most are associated with an account; the rest, with the person
+    directly, as imported or manually-added transactions are."""
+    if rng.random() < 0.04:
+        description, category, typical = rng.choice(INCOME_SOURCES)
+        sign = 1.0
+    else:
+        description, category, typical = rng.choice(MERCHANTS)
+        sign = -1.0
+
+    amount = round(sign * typical * rng.uniform(0.5, 1.5), 2)
+    # Card-style suffixes keep descriptions varied, as they are in real data.
+    full_description = f"{description.upper()} #{rng.randint(1, 9999)}"
+
+    if accounts and rng.random() < 0.9:
+        account = rng.choice(accounts)
+        return Transaction(
+            account=account,
+            owner=person,
+            institution_name=account.institution.name,
+            category=category.value,
+            amount=amount,
+            description=full_description,
+            description_norm=normalize_description(full_description),
+            merchant=description,
+            date=date_,
+            plaid_id=f"{rng.getrandbits(128):032x}",
+            currency_code="USD",
+            ignored=rng.random() < 0.01,
+        )
+
+    return Transaction(
+        person=person,
+        owner=person,
+        institution_name=rng.choice(INSTITUTIONS),
+        category=category.value,
+        amount=amount,
+        description=full_description,
+        description_norm=normalize_description(full_description),
+        merchant=description,
+        date=date_,
+        currency_code="USD",
+        notes="Imported" if rng.random() < 0.1 else "",
+        ignored=rng.random() < 0.01,
+    )
+
+
+def create_transactions(
+    person: Person,
+    accounts: List[FinancialAccount],
+    count: int,
+    rng: random.Random,
+    days: int = 10 * 365,
+    batch_size: int = 10_000,
+) -> int:
+    """Create approximately `count` transactions, spread over the past `days` days. Returns the
+    number created; generated duplicates are skipped."""
+    today = timezone.localdate()
+    count_before = Transaction.objects.count()
+
+    for batch_start in range(0, count, batch_size):
+        batch = [
+            make_transaction(
+                person, accounts, today - timedelta(days=rng.randrange(days)), rng
+            )
+            for _ in range(min(batch_size, count - batch_start))
+        ]
+
+        Transaction.objects.bulk_create(batch, ignore_conflicts=True)
+
+    return Transaction.objects.count() - count_before
@@ -0,0 +1,378 @@
+import json
+import random
+from datetime import date, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import DatabaseError
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+# `util` must load before `plaid_`, due to a circular import between them.
+from main import util, plaid_, asset_prices, export, jobs, rollups, synthetic
+from main.asset_prices import CryptoType
+from main.transaction_cats import TransactionCategory
+from main.models import (
+    AssetPrice,
+    CategoryRule,
+    ImportJob,
+    JobStatus,
+    RecurringDirection,
+    RecurringTransaction,
+    SubAccount,
+    Transaction,
+)
+
+
+def plaid_transaction(transaction_id: str, **fields) -> SimpleNamespace:
+    """A stand-in for a transaction from Plaid's sync endpoint, with only the fields we read."""
+    values = {
+        "transaction_id": transaction_id,
+        "name": "STARBUCKS 1234",
+        "amount": 4.5,
+        "date": date(2024, 3, 1),
+        "datetime": None,
+        "merchant_name": "Starbucks",
+        "iso_currency_code": "USD",
+        "pending": False,
+        "logo_url": None,
+        "category": None,
+        "personal_finance_category": SimpleNamespace(
+            primary="FOOD_AND_DRINK", detailed="FOOD_AND_DRINK_COFFEE"
+        ),
+    }
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.person = synthetic.create_person("sync@example.com")
+        (self.account,) = synthetic.create_accounts(self.person, 1, rng)
+
+    def test_add_transaction_without_merchant(self):
+        """Plaid often omits merchant names; these must not fail the sync."""
+        updates = plaid_.TransactionUpdates(
+            cursor="cursor-1",
+            sub_accs=[],
+            added=[
+                plaid_transaction(
+                    "no-merchant", merchant_name=None, iso_currency_code=None
+                ),
+                plaid_transaction("with-merchant", name="BLUE BOTTLE COFFEE"),
+            ],
+            modified=[],
+            removed=[],
+        )
+
+        plaid_.apply_transaction_updates(self.account, updates)
+
+        tran = Transaction.objects.get(plaid_id="no-merchant")
+        self.assertEqual(tran.merchant, "")
+        self.assertEqual(tran.currency_code, "")
+        self.assertTrue(Transaction.objects.filter(plaid_id="with-merchant").exists())
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.plaid_cursor, "cursor-1")
+
+    def test_account_failure_doesnt_stop_others(self):
+        """If saving one account's updates fails, the other accounts still refresh."""
+        failing, working = synthetic.create_accounts(
+            synthetic.create_person("sync2@example.com"), 2, random.Random(1)
+        )
+        accounts = [failing, working]
+
+        def fetch(account):
+            return plaid_.TransactionUpdates(
+                cursor=f"cursor-{account.id}",
+                sub_accs=[],
+                added=[plaid_transaction(f"tran-{account.id}")],
+                modified=[],
+                removed=[],
+            )
+
+        apply = plaid_.apply_transaction_updates
+
+        def apply_or_fail(account, updates):
+            if account.id == failing.id:
+                raise DatabaseError("Simulated failure")
+            apply(account, updates)
+
+        with (
+            mock.patch.object(plaid_, "fetch_transaction_updates", fetch),
+            mock.patch.object(plaid_, "apply_transaction_updates", apply_or_fail),
+            mock.patch.object(plaid_, "refresh_recurring") as refresh_recurring,
+        ):
+            new_data = plaid_.update_accounts(accounts)
+
+        self.assertTrue(new_data)
+        self.assertEqual(refresh_recurring.call_count, 2)
+
+        failing.refresh_from_db()
+        working.refresh_from_db()
+
+        self.assertEqual(working.plaid_cursor, f"cursor-{working.id}")
+        self.assertTrue(
+            Transaction.objects.filter(plaid_id=f"tran-{working.id}").exists()
+        )
+        self.assertGreater(
+            working.last_tran_refresh_success, failing.last_tran_refresh_success
+        )
+        self.assertNotEqual(failing.plaid_cursor, f"cursor-{failing.id}")
+
+
+class ImportTests(TestCase):
+    def test_import_counts_and_rollup(self):
+        person = synthetic.create_person("import@example.com")
+        csv_data = synthetic.mint_csv(2_500, random.Random(0))
+
+        with mock.patch.object(export, "IMPORT_BATCH_SIZE", 1_000):
+            first = export.import_csv_mint(StringIO(csv_data), person)
+            second = export.import_csv_mint(StringIO(csv_data), person)
+
+        self.assertEqual(first.inserted, person.transactions.count())
+        self.assertEqual(first.processed, 2_500)
+        self.assertEqual(second.inserted, 0)
+        self.assertEqual(second.skipped, first.inserted + first.skipped)
+        self.assertEqual(rollups.check_monthly_totals(person), [])
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.person = synthetic.create_person("jobs@example.com")
+
+    def test_latin_1_file(self):
+        csv_data = synthetic.mint_csv(10, random.Random(0)).splitlines()
+        # Row 1 is the first transaction; its description is the second field.
+        row = csv_data[1].split(",")
+        row[1] = "Café Olé"
+        csv_data[1] = ",".join(row)
+
+        jobs.enqueue_import(self.person, "\n".join(csv_data).encode("ISO-8859-1"))
+        job = jobs.claim_next_job()
+        jobs.run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DONE.value, job.error)
+        self.assertTrue(
+            Transaction.objects.filter(
+                person=self.person, description="Café Olé"
+            ).exists()
+        )
+
+    def test_requeue_by_heartbeat(self):
+        """Long-running jobs that are still making progress aren't re-queued."""
+        long_ago = timezone.now() - timedelta(seconds=jobs.STALE_JOB_TIMEOUT * 2)
+
+        alive = jobs.enqueue_import(self.person, b"")
+        dead = jobs.enqueue_import(self.person, b"")
+        ImportJob.objects.update(status=JobStatus.RUNNING.value, started=long_ago)
+        ImportJob.objects.filter(id=alive.id).update(heartbeat=timezone.now())
+        ImportJob.objects.filter(id=dead.id).update(heartbeat=long_ago)
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(alive.status, JobStatus.RUNNING.value)
+        self.assertEqual(dead.status, JobStatus.QUEUED.value)
+
+    def test_requeued_job_is_abandoned(self):
+        """A worker whose job was re-queued stops, and doesn't mark it done."""
+        jobs.enqueue_import(
+            self.person, synthetic.mint_csv(10, random.Random(0)).encode()
+        )
+        job = jobs.claim_next_job()
+
+        # Another worker re-queued the job, and claimed it again.
+        ImportJob.objects.filter(id=job.id).update(started=timezone.now())
+
+        jobs.run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.RUNNING.value)
+
+
+class RuleTests(TestCase):
+    def test_retroactive_matches_ingestion(self):
+        """If rules normalize to the same description, applying them to existing transactions gives
+        the same category as categorizing new ones."""
+        person = synthetic.create_person("rules@example.com")
+        tran = Transaction.objects.create(
+            person=person,
+            owner=person,
+            institution_name="",
+            category=TransactionCategory.UNCATEGORIZED.value,
+            amount=-4.5,
+            description="Starbucks",
+            date=date(2024, 3, 1),
+            currency_code="USD",
+        )
+
+        rules = [
+            CategoryRule.objects.create(
+                person=person,
+                description="STARBUCKS",
+                category=TransactionCategory.COFFEE_SHOP.value,
+            ),
+            CategoryRule.objects.create(
+                person=person,
+                description="Starbucks",
+                category=TransactionCategory.RESTAURANTS.value,
+            ),
+        ]
+        util.rules_changed(person)
+
+        expected = util.rule_matcher(person).match(tran.description_norm)
+        self.assertEqual(expected, TransactionCategory.COFFEE_SHOP.value)
+
+        for applied in [rules, rules[::-1], rules[:1], rules[1:]]:
+            util.apply_rules(applied, person)
+            tran.refresh_from_db()
+            self.assertEqual(tran.category, expected)
+
+
+class LoadTransactionsTests(TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.person = synthetic.create_person("load@example.com")
+        accounts = synthetic.create_accounts(self.person, 2, rng)
+        synthetic.create_transactions(self.person, accounts, 250, rng)
+
+        self.client.force_login(self.person.user)
+
+    def post(self, data: dict):
+        return self.client.post(
+            "/load-transactions",
+            json.dumps(data),
+            content_type="application/json",
+            secure=True,
+        )
+
+    def test_cursor_pages(self):
+        """Following cursors loads each transaction once, in order."""
+        ids = []
+        cursor = None
+
+        while True:
+            resp = self.post({"cursor": cursor, "page_size": 60})
+            self.assertEqual(resp.status_code, 200)
+
+            body = resp.json()
+            ids.extend(t["id"] for t in body["transactions"])
+
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+
+        expected = Transaction.objects.filter(owner=self.person).order_by(
+            "-date", "-id"
+        )
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+    def test_invalid_input(self):
+        for data in [
+            {"cursor": None, "page_size": "abc"},
+            {"cursor": None, "page_size": [1]},
+            {"cursor": "not-a-cursor"},
+            {"cursor": 5},
+        ]:
+            self.assertEqual(self.post(data).status_code, 400, data)
+
+        resp = self.post({"cursor": None, "page_size": -5})
+        self.assertEqual(len(resp.json()["transactions"]), 1)
+
+
+class QueryBudgetTests(TestCase):
+    """Query counts for our main views, so N+1 queries don't creep back in. These don't depend on
+    how much data a person has; if one changes, make sure that's still the case."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        cls.person = synthetic.create_person_with_data(
+            "budget@example.com", 2_000, 4, rng, snapshot_days=30
+        )
+
+        now = timezone.now()
+        for sub_acc in SubAccount.objects.filter(owner=cls.person):
+            if sub_acc.account is None:
+                continue
+
+            RecurringTransaction.objects.create(
+                account=sub_acc,
+                direction=RecurringDirection.OUTFLOW.value,
+                average_amount=15.0,
+                last_amount=15.0,
+                first_date=now.date(),
+                last_date=now.date(),
+                description="NETFLIX.COM",
+                merchant_name="Netflix",
+                status="MATURE",
+                category=0,
+                notes="",
+            )
+
+        # Don't refresh prices, or fetch them, during the tests.
+        AssetPrice.objects.bulk_create(
+            [AssetPrice(asset_type=c.value, price=1.0, updated=now) for c in CryptoType]
+        )
+        cls.person.accounts.update(last_refreshed_recurring=now)
+
+    def setUp(self):
+        self.client.force_login(self.person.user)
+        # Dashboard data is cached.
+        cache.clear()
+
+    def post(self, url: str, data: dict):
+        return self.client.post(
+            url, json.dumps(data), content_type="application/json", secure=True
+        )
+
+    def test_dash_data(self):
+        with self.assertNumQueries(4):
+            util.load_dash_data(self.person)
+
+    def test_dashboard(self):
+        with self.assertNumQueries(10):
+            self.assertEqual(
+                self.client.get("/dashboard", secure=True).status_code, 200
+            )
+
+    def test_transactions_page(self):
+        with self.assertNumQueries(4):
+            resp = self.post("/load-transactions", {"cursor": None})
+            self.assertEqual(resp.status_code, 200)
+
+    def test_recurring(self):
+        with self.assertNumQueries(5):
+            self.assertEqual(
+                self.client.get("/recurring", secure=True).status_code, 200
+            )
+
+    def test_edit_accounts(self):
+        accounts = [
+            {
+                "id": sub_acc.id,
+                "name": sub_acc.name,
+                "nickname": "Edited",
+                "asset_type": sub_acc.asset_type,
+                "asset_quantity": sub_acc.asset_quantity,
+                "iso_currency_code": sub_acc.iso_currency_code,
+                "current": sub_acc.current,
+            }
+            for sub_acc in SubAccount.objects.filter(owner=self.person)
+        ]
+
+        with self.assertNumQueries(7):
+            resp = self.post("/edit-accounts", {"accounts": accounts})
+            self.assertEqual(resp.status_code, 200)
+
+        self.assertFalse(
+            SubAccount.objects.filter(owner=self.person)
+            .exclude(nickname="Edited")
+            .exists()
+        )
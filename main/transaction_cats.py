@@ -1,6 +1,8 @@
 # A dedicated file for transaction categories, due to its size.
 from enum import Enum
-from typing import List, Iterable
+from functools import lru_cache
+from itertools import combinations
+from typing import FrozenSet, List, Iterable, Optional, Union
 
 from django.core.mail import send_mail
 
@@ -111,9 +113,19 @@ class TransactionCategory(Enum):
 
     @classmethod
     def from_str(cls, s: str) -> "TransactionCategory":
-        """A little loose. We currently use it for both Plaid, and mint."""
+        """A little loose. We currently use it for both Plaid, and mint. Common names are looked up
+        from a table; others are parsed, and memoized."""
         s = s.lower()
 
+        result = CATEGORY_NAME_TABLE.get(s)
+        if result is not None:
+            return result
+
+        return _from_str_uncommon(s)
+
+    @classmethod
+    def _parse_str(cls, s: str) -> Optional["TransactionCategory"]:
+        """Parse a lowercase category name. Returns None if we don't recognize it."""
         if "uncategorized" == s or "misc expenses" in s:
             return cls.UNCATEGORIZED
         if "food" in s or "grocer" in s:
@@ -229,11 +241,7 @@ class TransactionCategory(Enum):
         ):  # todo eh on dept stores. shopping?
             return cls.CLOTHING
 
-        msg = f"Fallthrough in parsing transaction category: {s}"
-        print(msg)
-        send_debug_email(msg)
-
-        return cls.UNCATEGORIZED
+        return None
 
     def to_str(self) -> str:
         if self == TransactionCategory.UNCATEGORIZED:
@@ -404,18 +412,194 @@ class TransactionCategory(Enum):
 
     @classmethod
     def from_plaid(
-        cls, cats_raw: List[str], descrip: str, rules: Iterable["CategoryRule"]
+        cls,
+        cats_raw: List[str],
+        descrip: str,
+        rules: Union["RuleMatcher", Iterable["CategoryRule"]],
+        pfc_detailed: Optional[str] = None,
     ) -> "TransactionCategory":
+        """Categorize from Plaid's (legacy) category list, eg `["Food and Drink", "Restaurants"]`.
+        If not present, use the personal finance category code, eg `FOOD_AND_DRINK_COFFEE`.
+        """
         if cats_raw is not None and len(cats_raw):
-            category = cleanup_categories(
-                TransactionCategory.from_str(c) for c in cats_raw
-            )[0]
+            cats = [TransactionCategory.from_str(c) for c in cats_raw]
+            remaining = resolve_categories(frozenset(cats))
+
+            # Plaid lists categories from general to specific; use the most specific remaining.
+            category = next(c for c in reversed(cats) if c in remaining)
+        elif pfc_detailed:
+            category = category_from_pfc(pfc_detailed)
         else:
             category = TransactionCategory.UNCATEGORIZED
 
         return category_override(descrip, category, rules)
 
 
+@lru_cache(maxsize=1024)
+def _from_str_uncommon(s: str) -> TransactionCategory:
+    """Parse a lowercase category name that's not in `CATEGORY_NAME_TABLE`."""
+    result = TransactionCategory._parse_str(s)
+
+    if result is None:
+        msg = f"Fallthrough in parsing transaction category: {s}"
+        print(msg)
+        send_debug_email(msg)
+
+        return TransactionCategory.UNCATEGORIZED
+
+    return result
+
+
+# Category names Plaid commonly sends, at all levels of its (legacy) category hierarchy.
+PLAID_CATEGORY_NAMES = [
+    "Airlines and Aviation Services",
+    "ATM",
+    "Bank Fees",
+    "Bar",
+    "Beauty Products",
+    "Bookstores",
+    "Business Services",
+    "Cable",
+    "Car Service",
+    "Charities and Non-Profits",
+    "Clothing and Accessories",
+    "Coffee Shop",
+    "Community",
+    "Computers and Electronics",
+    "Credit",
+    "Credit Card",
+    "Debit",
+    "Department Stores",
+    "Deposit",
+    "Digital Purchase",
+    "Discount Stores",
+    "Education",
+    "Entertainment",
+    "Fast Food",
+    "Financial",
+    "Food and Drink",
+    "Gas Stations",
+    "Government Departments and Agencies",
+    "Gyms and Fitness Centers",
+    "Hardware Store",
+    "Healthcare",
+    "Home Improvement",
+    "Hotels and Motels",
+    "Insurance",
+    "Interest",
+    "Interest Charged",
+    "Internal Account Transfer",
+    "Lodging",
+    "Office Supplies",
+    "Overdraft",
+    "Parking",
+    "Payment",
+    "Payroll",
+    "Personal Care",
+    "Pets",
+    "Pharmacies",
+    "Recreation",
+    "Rent",
+    "Restaurants",
+    "Service",
+    "Shipping and Freight",
+    "Shops",
+    "Sporting Goods",
+    "Subscription",
+    "Supermarkets and Groceries",
+    "Tax",
+    "Taxi",
+    "Telecommunication Services",
+    "Third Party",
+    "Transfer",
+    "Travel",
+    "Utilities",
+    "Warehouses and Wholesale Stores",
+    "Withdrawal",
+]
+
+# Lowercase category name to category. This gives the same results as parsing.
+CATEGORY_NAME_TABLE = {}
+for _name in PLAID_CATEGORY_NAMES:
+    _cat = TransactionCategory._parse_str(_name.lower())
+    if _cat is not None:
+        CATEGORY_NAME_TABLE[_name.lower()] = _cat
+
+# Category value to display name, eg for exports.
+CATEGORY_DISPLAY_NAMES = {cat.value: cat.to_str() for cat in TransactionCategory}
+
+# Plaid's personal finance category codes. We use these if the legacy categories aren't present.
+# https://plaid.com/documents/transactions-personal-finance-category-taxonomy.csv
+PFC_PRIMARY = {
+    "INCOME": TransactionCategory.INCOME,
+    "TRANSFER_IN": TransactionCategory.TRANSFER,
+    "TRANSFER_OUT": TransactionCategory.TRANSFER,
+    "LOAN_PAYMENTS": TransactionCategory.PAYMENT,
+    "BANK_FEES": TransactionCategory.FEES,
+    "ENTERTAINMENT": TransactionCategory.ENTERTAINMENT,
+    "FOOD_AND_DRINK": TransactionCategory.RESTAURANTS,
+    "GENERAL_MERCHANDISE": TransactionCategory.SHOPS,
+    "HOME_IMPROVEMENT": TransactionCategory.HOME_AND_GARDEN,
+    "MEDICAL": TransactionCategory.MEDICAL,
+    "PERSONAL_CARE": TransactionCategory.HEALTH_AND_PERSONAL_CARE,
+    "GENERAL_SERVICES": TransactionCategory.BUSINESS_SERVICES,
+    "GOVERNMENT_AND_NON_PROFIT": TransactionCategory.BUSINESS_SERVICES,
+    "TRANSPORTATION": TransactionCategory.CAR,
+    "TRAVEL": TransactionCategory.TRAVEL,
+    "RENT_AND_UTILITIES": TransactionCategory.BILLS_AND_UTILITIES,
+}
+
+# Detailed codes that map to a different category than their primary code.
+PFC_DETAILED = {
+    "TRANSFER_IN_DEPOSIT": TransactionCategory.DEPOSIT,
+    "TRANSFER_IN_INVESTMENT_AND_RETIREMENT_FUNDS": TransactionCategory.INVESTMENTS,
+    "TRANSFER_OUT_INVESTMENT_AND_RETIREMENT_FUNDS": TransactionCategory.INVESTMENTS,
+    "TRANSFER_OUT_WITHDRAWAL": TransactionCategory.WITHDRAWAL,
+    "LOAN_PAYMENTS_CREDIT_CARD_PAYMENT": TransactionCategory.CREDIT_CARD,
+    "LOAN_PAYMENTS_MORTGAGE_PAYMENT": TransactionCategory.MORTGAGE_AND_RENT,
+    "LOAN_PAYMENTS_CAR_PAYMENT": TransactionCategory.CAR,
+    "FOOD_AND_DRINK_BEER_WINE_AND_LIQUOR": TransactionCategory.ALCOHOL,
+    "FOOD_AND_DRINK_COFFEE": TransactionCategory.COFFEE_SHOP,
+    "FOOD_AND_DRINK_FAST_FOOD": TransactionCategory.FAST_FOOD,
+    "FOOD_AND_DRINK_GROCERIES": TransactionCategory.GROCERIES,
+    "GENERAL_MERCHANDISE_CLOTHING_AND_ACCESSORIES": TransactionCategory.CLOTHING,
+    "GENERAL_MERCHANDISE_DEPARTMENT_STORES": TransactionCategory.CLOTHING,
+    "GENERAL_MERCHANDISE_ELECTRONICS": TransactionCategory.ELECTRONICS,
+    "GENERAL_MERCHANDISE_GIFTS_AND_NOVELTIES": TransactionCategory.GIFTS,
+    "GENERAL_MERCHANDISE_OFFICE_SUPPLIES": TransactionCategory.BUSINESS_SERVICES,
+    "GENERAL_MERCHANDISE_PET_SUPPLIES": TransactionCategory.PETS,
+    "GENERAL_MERCHANDISE_SPORTING_GOODS": TransactionCategory.SPORTING_GOODS,
+    "MEDICAL_PHARMACIES_AND_SUPPLEMENTS": TransactionCategory.HEALTH_AND_PERSONAL_CARE,
+    "MEDICAL_VETERINARY_SERVICES": TransactionCategory.PETS,
+    "PERSONAL_CARE_GYMS_AND_FITNESS_CENTERS": TransactionCategory.GYMS_AND_FITNESS_CENTERS,
+    "GENERAL_SERVICES_AUTOMOTIVE": TransactionCategory.CAR,
+    "GENERAL_SERVICES_CHILDCARE": TransactionCategory.CHILDREN,
+    "GENERAL_SERVICES_EDUCATION": TransactionCategory.EDUCATION,
+    "GENERAL_SERVICES_INSURANCE": TransactionCategory.BILLS_AND_UTILITIES,
+    "GOVERNMENT_AND_NON_PROFIT_DONATIONS": TransactionCategory.GIFTS,
+    "GOVERNMENT_AND_NON_PROFIT_TAX_PAYMENT": TransactionCategory.TAXES,
+    "TRANSPORTATION_TAXIS_AND_RIDE_SHARES": TransactionCategory.TAXI,
+    "TRANSPORTATION_PUBLIC_TRANSIT": TransactionCategory.TRAVEL,
+    "TRAVEL_FLIGHTS": TransactionCategory.AIRLINES_AND_AVIATION_SERVICES,
+    "RENT_AND_UTILITIES_RENT": TransactionCategory.MORTGAGE_AND_RENT,
+}
+
+
+@lru_cache(maxsize=256)
+def category_from_pfc(detailed: str) -> TransactionCategory:
+    """Categorize from a personal finance category detailed code, eg `FOOD_AND_DRINK_COFFEE`."""
+    result = PFC_DETAILED.get(detailed)
+    if result is not None:
+        return result
+
+    # Detailed codes are prefixed with their primary code.
+    for primary, cat in PFC_PRIMARY.items():
+        if detailed.startswith(primary + "_"):
+            return cat
+
+    return TransactionCategory.UNCATEGORIZED
+
+
 CATS_NON_SPENDING = [
     TransactionCategory.PAYMENT,
     TransactionCategory.INCOME,
@@ -429,6 +613,21 @@ CATS_NON_SPENDING = [
 ]
 
 
+CAT_VALS_NON_SPENDING = {c.value for c in CATS_NON_SPENDING}
+
+
+def is_spending(category: int, ignored: bool) -> bool:
+    """Determine if a transaction counts as spending, eg vice income or a transfer."""
+    if ignored:
+        return False
+
+    # For now, assume all custom categories are considered to be spending.
+    if category > 1_000:
+        return True
+
+    return category not in CAT_VALS_NON_SPENDING
+
+
 class TransactionCategoryDiscret(Enum):
     """Our broadest grouping"""
 
@@ -724,30 +923,112 @@ replacements = [
 ]
 
 
+class KeywordMatcher:
+    """Finds which of a list of keywords appear in a string, in a single pass over the string,
+    regardless of the number of keywords. (An Aho-Corasick automaton)"""
+
+    def __init__(self, keywords: List[str]):
+        # Each node is a dict of character to child node index. `_best[node]` is the index of the
+        # last keyword (in list order) that ends at this node, or at any of its suffixes; -1 if none.
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [-1]
+
+        for i, keyword in enumerate(keywords):
+            node = 0
+            for char in keyword:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(-1)
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._best[node] = max(self._best[node], i)
+
+        # Link each node to the node of its longest proper suffix in the trie, breadth-first.
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._best[child] = max(
+                    self._best[child], self._best[self._fail[child]]
+                )
+                queue.append(child)
+
+    def last_match(self, text: str) -> int:
+        """The index of the last keyword, in list order, that appears in `text`; -1 if none do."""
+        goto = self._goto
+        fail = self._fail
+        best = self._best
+
+        result = -1
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if best[node] > result:
+                result = best[node]
+
+        return result
+
+
+KEYWORD_MATCHER = KeywordMatcher([keyword for keyword, _ in replacements])
+
+
+def normalize_description(descrip: str) -> str:
+    """Normalize a transaction or rule description for matching against keywords and rules. We store
+    this for transactions and rules, as `description_norm`."""
+    # Remove apostrophes, as in "McDonald's".
+    return descrip.lower().strip().replace("'", "").replace("&", "").replace(" ", "")
+
+
+class RuleMatcher:
+    """A person's category rules, indexed by normalized description. Build this once, then use it
+    for many transactions; see `util.rule_matcher`."""
+
+    def __init__(self, rules: Iterable["CategoryRule"]):
+        # Normalized description to category. If multiple rules normalize to the same description,
+        # the first one applies.
+        self.rules = {}
+        for rule in rules:
+            self.rules.setdefault(rule.description_norm, rule.category)
+
+    def match(self, descrip_normalized: str) -> Optional[int]:
+        """The category value of the rule matching a normalized description, if any."""
+        return self.rules.get(descrip_normalized)
+
+
 def category_override(
     # Avoid a circular import by not importing CategoryRule
     descrip: str,
     category: TransactionCategory,
-    rules: Iterable["CategoryRule"],
+    rules: Union[RuleMatcher, Iterable["CategoryRule"]],
 ) -> TransactionCategory:
-    """Manual category overrides, based on observation. Note: This is currently handled prior to adding to the DB."""
-    # Remove apostrophes, as in "McDonald's".
-    descrip = descrip.lower().strip().replace("'", "").replace("&", "").replace(" ", "")
+    """Manual category overrides, based on observation. Note: This is currently handled prior to adding to the DB.
+    When categorizing many transactions, pass a `RuleMatcher`, vice the rules themselves.
+    """
+    descrip = normalize_description(descrip)
     # Some category overrides. Separate function A/R
 
-    for keyword, cat in replacements:
-        if keyword in descrip:
-            category = cat
+    # If multiple keywords match, the last in the list applies.
+    keyword_i = KEYWORD_MATCHER.last_match(descrip)
+    if keyword_i != -1:
+        category = replacements[keyword_i][1]
 
-    for rule in rules:
-        if descrip.strip() == rule.description.lower().replace("&", "").replace(
-            " ", ""
-        ):
-            if rule.category > 1_000:
-                # todo: Is this how to handle a custom cat?
-                return TransactionCategory.UNCATEGORIZED
-            else:
-                return TransactionCategory(rule.category)
+    if not isinstance(rules, RuleMatcher):
+        rules = RuleMatcher(rules)
+
+    rule_cat = rules.match(descrip)
+    if rule_cat is not None:
+        if rule_cat > 1_000:
+            # todo: Is this how to handle a custom cat?
+            return TransactionCategory.UNCATEGORIZED
+        else:
+            return TransactionCategory(rule_cat)
 
     return category
 
@@ -758,6 +1039,18 @@ def cleanup_categories(cats: List[TransactionCategory]) -> List[TransactionCateg
     Return the result, due to Python's sloppy mutation-in-place.
 
     Note that this is set up for"""
+    cats = _cleanup_categories(cats)
+
+    if len(cats) > 1:
+        print(">1 len categories: \n", cats)
+
+    return cats
+
+
+def _cleanup_categories(
+    cats: Iterable[TransactionCategory],
+) -> List[TransactionCategory]:
+    """`cleanup_categories`, without logging."""
     cats = list(set(cats))  # Remove duplicates.
 
     if (
@@ -853,7 +1146,26 @@ def cleanup_categories(cats: List[TransactionCategory]) -> List[TransactionCateg
     if TransactionCategory.UNCATEGORIZED in cats and len(cats) > 1:
         cats.remove(TransactionCategory.UNCATEGORIZED)
 
-    if len(cats) > 1:
-        print(">1 len categories: \n", cats)
-
     return cats
+
+
+@lru_cache(maxsize=1024)
+def resolve_categories(
+    cats: FrozenSet[TransactionCategory],
+) -> FrozenSet[TransactionCategory]:
+    """The categories that remain after cleanup. Single categories, and pairs, are looked up
+    from a table; larger sets are computed, and memoized."""
+    result = CATEGORY_RESOLUTION_TABLE.get(cats)
+    if result is not None:
+        return result
+
+    return frozenset(_cleanup_categories(cats))
+
+
+# The result of cleanup for each single category, and each pair of categories.
+CATEGORY_RESOLUTION_TABLE = {}
+for _size in [1, 2]:
+    for _cats in combinations(TransactionCategory, _size):
+        CATEGORY_RESOLUTION_TABLE[frozenset(_cats)] = frozenset(
+            _cleanup_categories(_cats)
+        )
@@ -1,16 +1,19 @@
 # Misc / utility functions
+import base64
 import json
 from typing import List, Dict, Iterable, Optional, Tuple
 from datetime import date, timedelta, datetime
 from dateutil.relativedelta import relativedelta
 
+from django.core.cache import cache
 from django.core.mail import send_mail
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Case, F, Q, Count, Sum, Value, When
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 from django.utils import timezone
 
-from main import transaction_cats
+from main import asset_prices, transaction_cats, rollups
 from main.models import (
     AccountType,
     FinancialAccount,
@@ -21,15 +24,56 @@ from main.models import (
     SnapshotAccount,
     SnapshotPerson,
     CategoryRule,
+    MonthlyCategoryTotal,
 )
+from main.asset_prices import CryptoType
 from main.plaid_ import TRAN_REFRESH_INTERVAL, HOUR
 from wallet import settings
-from main.transaction_cats import TransactionCategory, TransactionCategoryDiscret
+from main.transaction_cats import (
+    RuleMatcher,
+    TransactionCategory,
+    TransactionCategoryDiscret,
+)
 
 # Show an account as unhealthy if the last successful refresh was older than this.
 # Must be higher than the refresh interval.
 ACCOUNT_UNHEALTHY_REFRESH_HOURS = TRAN_REFRESH_INTERVAL / HOUR
 
+# The transaction fields used by spending analytics.
+SPENDING_FIELDS = (
+    "date",
+    "category",
+    "amount",
+    "ignored",
+    "description",
+    "merchant",
+    "logo_url",
+)
+
+# This can be low; large purchases will be rank-limited.
+LARGE_PURCHASE_THRESH = 150.0
+# The dashboard displays only the top few large purchases.
+LARGE_PURCHASES_MAX = 20
+
+# Rows per insert when saving snapshots.
+SNAPSHOT_BATCH_SIZE = 1_000
+
+CAT_VALS_DISCRET = {
+    c.value: TransactionCategoryDiscret.from_cat(c) for c in TransactionCategory
+}
+
+# Cached rule matchers are keyed by rules version, so this is only a backstop, eg for edits made
+# outside the app.
+RULE_MATCHER_CACHE_TIMEOUT = 24 * HOUR  # seconds.
+
+# Rules applied to existing transactions per query; this bounds query size.
+RULES_PER_UPDATE = 100
+
+# Cached dashboard data is keyed by data version, so this only limits how out-of-date time-dependent
+# parts, like asset prices, get.
+DASH_DATA_CACHE_TIMEOUT = 5 * 60  # seconds.
+
+
 def unw_helper(net_worth: float, sub_acc: SubAccount) -> float:
     if not sub_acc.ignored and sub_acc.get_value() is not None:
         sign = 1
@@ -66,20 +110,21 @@ def load_transactions(
     are combined from all sub-accounts."""
     # todo: Pending? Would have to parse into the DB.
 
-    trans = Transaction.objects.filter(Q(account__person=person) | Q(person=person))
+    trans = Transaction.objects.filter(owner=person)
 
     if search_text:
         search_text = search_text.lower()
 
         cat_vals = [c[0] for c in transaction_cats.CAT_NAMES if search_text in c[1]]
         print(cat_vals, "CAT_VALS", "SEARCH TEXT: ", search_text)
-        trans = trans.filter(
-            Q(description__icontains=search_text)
-            | Q(notes__icontains=search_text)
-            | Q(institution_name__icontains=search_text)
-            | Q(category__in=cat_vals)
-            | Q(merchant__icontains=search_text)
-        )
+
+        # `search_text` is a lowercased concatenation of description, notes, institution name, and
+        # merchant. On Postgres, this substring match is served by a trigram index.
+        search_filter = Q(search_text__contains=search_text)
+        if cat_vals:
+            search_filter |= Q(category__in=cat_vals)
+
+        trans = trans.filter(search_filter)
 
     if start is not None:
         trans = trans.filter(date__gte=start)
@@ -97,6 +142,53 @@ def load_transactions(
     return trans
 
 
+def encode_tran_cursor(tran: Transaction) -> str:
+    """Create an opaque cursor pointing to a transaction's position, for keyset pagination."""
+    return base64.urlsafe_b64encode(
+        f"{tran.date.isoformat()}|{tran.id}".encode()
+    ).decode()
+
+
+def decode_tran_cursor(cursor: str) -> Tuple[date, int]:
+    """Parse a cursor created by `encode_tran_cursor`. Raises `ValueError` if it's invalid."""
+    try:
+        date_, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(date_), int(id_)
+    # `AttributeError` is from non-string cursors, eg numbers in a request.
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid transaction cursor: {cursor}") from e
+
+
+def load_transactions_page(
+    person: Person,
+    search_text: Optional[str],
+    start: Optional[date],
+    end: Optional[date],
+    category: Optional[TransactionCategory],
+    cursor: Optional[str],
+    page_size: int,
+) -> Tuple[List[Transaction], Optional[str]]:
+    """Load a page of transactions using keyset pagination, ordered by date, then ID; both descending.
+    Pass the `cursor` returned with one page to load the next; `None` loads the first page. Unlike
+    offsets, the cost of loading a page doesn't depend on how deep it is. Returns the transactions,
+    and the cursor for the next page; `None` if this is the last one."""
+    trans = load_transactions(None, None, person, search_text, start, end, category)
+
+    if cursor is not None:
+        cursor_date, cursor_id = decode_tran_cursor(cursor)
+        trans = trans.filter(
+            Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id)
+        )
+
+    page = list(trans.order_by("-date", "-id")[:page_size])
+
+    next_cursor = None
+    if len(page) == page_size:
+        next_cursor = encode_tran_cursor(page[-1])
+
+    return page, next_cursor
+
+
 def setup_month_picker() -> List[Tuple[str, str, str]]:
     """Creates items, for use in a template, to create buttons that select date ranges for each month going backwards."""
     result = []
@@ -182,10 +274,27 @@ def create_totals(sub_accounts: List[SubAccount]) -> dict:
 
 
 def load_dash_data(person: Person, no_preser: bool = False) -> Dict:
-    """Load account balances, transactions, and totals."""
-    sub_accounts = SubAccount.objects.filter(
-        Q(account__person=person) | Q(person=person)
+    """Load account balances, transactions, and totals. This is cached until the person's data
+    changes (see `data_changed`), or for `DASH_DATA_CACHE_TIMEOUT`, since asset prices, account
+    health, and date displays change over time."""
+    key = f"dash_data_{person.id}_{person.data_version}_{int(no_preser)}"
+
+    data = cache.get(key)
+    if data is None:
+        data = _load_dash_data(person, no_preser)
+        cache.set(key, data, DASH_DATA_CACHE_TIMEOUT)
+
+    return data
+
+
+def _load_dash_data(person: Person, no_preser: bool) -> Dict:
+    """Load the data for `load_dash_data`, without caching."""
+    # `serialize` and the health check below use the account and institution.
+    sub_accounts = SubAccount.objects.filter(owner=person).select_related(
+        "account__institution"
     )
+    # This evaluates the queryset; below, we re-use the sub-accounts, with prices attached.
+    asset_prices.prefetch_prices(sub_accounts)
     totals_display = create_totals(sub_accounts)
 
     no_accs = sub_accounts.count() == 0
@@ -202,20 +311,20 @@ def load_dash_data(person: Person, no_preser: bool = False) -> Dict:
         accs = json.dumps(accs)
         tran = json.dumps(tran)
 
-    # return health status, by (institution-level) account.
+    # return health status of linked sub-accounts, by their (institution-level) account.
     acc_health = []
     now = timezone.now()
-    for acc in person.accounts.all():
-        if (
+    for sub_acc in sub_accounts:
+        if sub_acc.account is None:
+            continue
+
+        healthy = (
             # now - acc.last_balance_refresh_success
             now
-            - acc.last_tran_refresh_success
-        ).total_seconds() > ACCOUNT_UNHEALTHY_REFRESH_HOURS * 3600:
-            for sub_acc in acc.sub_accounts.all():
-                acc_health.append([sub_acc.id, False])
-        else:
-            for sub_acc in acc.sub_accounts.all():
-                acc_health.append([sub_acc.id, True])
+            - sub_acc.account.last_tran_refresh_success
+        ).total_seconds() <= ACCOUNT_UNHEALTHY_REFRESH_HOURS * 3600
+
+        acc_health.append([sub_acc.id, healthy])
 
     if not no_preser:
         acc_health = json.dumps(acc_health)
@@ -230,65 +339,128 @@ def load_dash_data(person: Person, no_preser: bool = False) -> Dict:
     }
 
 
-def take_snapshots(accounts: Iterable[FinancialAccount], person: Person):
-    now = timezone.now()
-    net_worth = 0.0
+def take_snapshots(person: Person):
+    """Save snapshots of a person's sub-accounts' values, and their net worth."""
+    save_snapshots(SubAccount.objects.filter(owner=person))
 
-    for account in accounts:
-        for sub in account.sub_accounts.all():
-            snap = SnapshotAccount(
-                account=sub, account_name=sub.name, dt=now, value=sub.get_value()
-            )
-            snap.save()
 
-            print("Snap saved acct: ", snap)
+def save_snapshots(sub_accounts: Iterable[SubAccount]) -> int:
+    """Save snapshots of sub-accounts' values, and of their owners' net worth, in bulk. There's one
+    snapshot per account or person per day; taking another that day replaces it. Returns the number
+    of people snapshotted."""
+    now = timezone.now()
+    today = timezone.localdate(now)
+
+    sub_accounts = list(sub_accounts)
+    asset_prices.prefetch_prices(sub_accounts)
+
+    snaps_account = []
+    net_worths = {}  # By person ID.
+
+    for sub in sub_accounts:
+        snaps_account.append(
+            SnapshotAccount(
+                account=sub,
+                account_name=sub.name,
+                dt=now,
+                date=today,
+                value=sub.get_value(),
+            )
+        )
+        net_worths[sub.owner_id] = unw_helper(net_worths.get(sub.owner_id, 0.0), sub)
 
-            net_worth = unw_helper(net_worth, sub)
+    snaps_person = [
+        SnapshotPerson(person_id=person_id, dt=now, date=today, value=net_worth)
+        for person_id, net_worth in net_worths.items()
+    ]
 
-    snap_person = SnapshotPerson(
-        person=person,
-        dt=now,
-        value=net_worth,
-    )
+    with transaction.atomic():
+        SnapshotAccount.objects.bulk_create(
+            snaps_account,
+            batch_size=SNAPSHOT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["account", "date"],
+            update_fields=["account_name", "dt", "value"],
+        )
+        SnapshotPerson.objects.bulk_create(
+            snaps_person,
+            batch_size=SNAPSHOT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["person", "date"],
+            update_fields=["dt", "value"],
+        )
 
-    print("Snap saved person: ", snap_person)
+    return len(snaps_person)
 
-    snap_person.save()
 
+def revalue_asset_snapshots(person: Person) -> int:
+    """Recompute the values of a person's asset (eg crypto) sub-account snapshots from stored daily
+    prices, and adjust their net worth snapshots from the same days by the difference. This
+    makes no API calls; run `backfill_asset_prices` first. We don't store the history of asset
+    quantities, so this uses current ones. Returns the number of snapshots changed."""
+    snaps = list(
+        SnapshotAccount.objects.filter(
+            account__owner=person, account__asset_type__isnull=False
+        ).select_related("account")
+    )
+    if not snaps:
+        return 0
+
+    days = [snap.date for snap in snaps]
+    prices = asset_prices.daily_prices(
+        {CryptoType(snap.account.asset_type) for snap in snaps},
+        min(days) - timedelta(days=asset_prices.MAX_PRICE_GAP),
+        max(days),
+    )
 
-def filter_trans_spending(trans) -> List[Transaction]:
-    """Filter transactions to only include spending categories."""
-    result = []
+    changed = []
+    net_worth_changes = {}  # By snapshot date.
 
-    for tran in trans:
-        if tran.ignored:
+    for snap, day in zip(snaps, days):
+        sub_acc = snap.account
+        price = asset_prices.price_on(prices[CryptoType(sub_acc.asset_type)], day)
+        if price is None:
             continue
 
-        # For now, assume all custom categories are considered to be spending.
-        if tran.category > 1_000:
-            result.append(tran)
+        value = price * sub_acc.asset_quantity
+        if value == snap.value:
             continue
 
-        cat = TransactionCategory(tran.category)
+        # As in `unw_helper`.
+        sign = (
+            -1
+            if AccountType(sub_acc.type) in [AccountType.LOAN, AccountType.CREDIT]
+            else 1
+        )
+        net_worth_changes[day] = net_worth_changes.get(day, 0.0) + sign * (
+            value - snap.value
+        )
 
-        if cat not in transaction_cats.CATS_NON_SPENDING:
-            result.append(tran)
+        snap.value = value
+        changed.append(snap)
 
-    return result
+    person_snaps = list(
+        SnapshotPerson.objects.filter(person=person, date__in=net_worth_changes)
+    )
+    for snap in person_snaps:
+        snap.value += net_worth_changes[snap.date]
 
+    with transaction.atomic():
+        SnapshotAccount.objects.bulk_update(changed, ["value"], batch_size=1_000)
+        SnapshotPerson.objects.bulk_update(person_snaps, ["value"], batch_size=1_000)
 
-# def setup_spending_highlights(accounts: Iterable[FinancialAccount], person: Person, num_days: int) -> List[Tuple[TransactionCategory, List[int, float, Dict[str, str]]]]:
-def setup_spending_highlights(
-    person: Person, start_days_back: int, end_days_back: int, is_lookback: bool
-):
-    """Find the biggest recent spending highlights."""
-    if start_days_back is None:  # Perhaps invalid data from the date picker.
-        start_days_back = 30
-    if end_days_back is None:
-        end_days_back = 0
+    return len(changed)
 
-    now = timezone.now()
 
+def filter_trans_spending(trans) -> List[Transaction]:
+    """Filter transactions to only include spending categories."""
+    return [t for t in trans if transaction_cats.is_spending(t.category, t.ignored)]
+
+
+def days_back_range(
+    now: datetime, start_days_back: int, end_days_back: int
+) -> Tuple[date, date]:
+    """Convert a range specified in days before now, eg from the date picker, to dates."""
     try:
         start = now - timedelta(days=start_days_back)
         end = now - timedelta(days=end_days_back)
@@ -297,166 +469,244 @@ def setup_spending_highlights(
         start = now - timedelta(days=30)
         end = now
 
-    # todo: We likely have already loaded these transactions. Optimize later.
-    # todo: Maybe cache, this and run it once in a while? Or always load 30 days of trans?
-    trans = load_transactions(None, None, person, "", start, end, None)
+    return timezone.localtime(start).date(), timezone.localtime(end).date()
 
-    by_cat = {}
-    large_transactions = []
 
-    total = 0.0
+def load_spending_rows(person: Person, start: date, end: date):
+    """Load the transaction fields used by spending analytics, as named tuples. This avoids
+    instantiating full models when we're only summing and grouping."""
+    return load_transactions(None, None, person, None, start, end, None).values_list(
+        *SPENDING_FIELDS, named=True
+    )
 
-    # # This can be low; large purchases will be rank-limited.
-    LARGE_PURCHASE_THRESH = 150.0
 
-    trans_spending = filter_trans_spending(trans)
+def load_transactions_spending(person: Person, start: date, end: date):
+    """Load spending transactions; the database-side equivalent of `filter_trans_spending`."""
+    return (
+        load_transactions(None, None, person, None, start, end, None)
+        .filter(ignored=False)
+        .exclude(category__in=transaction_cats.CAT_VALS_NON_SPENDING)
+    )
 
-    for tran in trans_spending:
-        cat = tran.category
 
-        if cat not in by_cat.keys():
-            by_cat[cat] = [1, tran.amount]  # count, total
-        else:
-            by_cat[cat][0] += 1
-            by_cat[cat][1] += tran.amount
+def _highlights_blank() -> dict:
+    return {"by_cat": {}, "total": 0.0, "large_purchases": []}
 
-        if abs(tran.amount) >= LARGE_PURCHASE_THRESH:
-            large_transactions.append(
-                {"description": tran.description, "amount": tran.amount}
-            )
 
-        total += tran.amount
+def _highlights_add(highlights: dict, tran) -> None:
+    """Add a spending transaction to a highlights accumulator."""
+    by_cat = highlights["by_cat"]
 
-    # Sort by value
-    by_cat = sorted(by_cat.items(), key=lambda x: x[1][1])
-    large_transactions = sorted(large_transactions, key=lambda x: x["amount"])
+    if tran.category not in by_cat:
+        by_cat[tran.category] = [1, tran.amount]  # count, total
+    else:
+        by_cat[tran.category][0] += 1
+        by_cat[tran.category][1] += tran.amount
 
-    total_change = None
-    # This check prevents an infinite recursion.
-    if not is_lookback:
-        # todo: We don't need to compute the entire data set for the previous period.; just the relevant parts.
-        data_prev_month = setup_spending_highlights(
-            person, start_days_back * 2, start_days_back, True
+    if abs(tran.amount) >= LARGE_PURCHASE_THRESH:
+        highlights["large_purchases"].append(
+            {"description": tran.description, "amount": tran.amount}
         )
-        total_change = total - data_prev_month["total"]
 
-        cat_changes = []
-        for c in by_cat:
-            prev = [d for d in data_prev_month["by_cat"] if d[0] == c[0]]
-            if len(prev):
-                prev_amt = prev[0][1][1]
-            else:
-                prev_amt = 0.0
+    highlights["total"] += tran.amount
+
+
+def _highlights_finish(highlights: dict, highlights_prev: Optional[dict]) -> dict:
+    """Sort accumulated highlights, and compare them to the previous period's, if available."""
+    # Sort by value
+    by_cat = sorted(highlights["by_cat"].items(), key=lambda x: x[1][1])
+    large_transactions = sorted(
+        highlights["large_purchases"], key=lambda x: x["amount"]
+    )[:LARGE_PURCHASES_MAX]
+
+    total_change = None
+    cat_changes = []
 
-            diff = c[1][1] - prev_amt
+    if highlights_prev is not None:
+        total_change = highlights["total"] - highlights_prev["total"]
 
-            cat_changes.append([c[0], diff])
+        for cat, (_count, amount) in by_cat:
+            prev_amt = highlights_prev["by_cat"].get(cat, [0, 0.0])[1]
+            cat_changes.append([cat, amount - prev_amt])
 
         cat_changes.sort(key=lambda c: abs(c[1]), reverse=True)
         # todo: Take into account cats missing this month that  were prsent the prev.
-    else:
-        cat_changes = []
 
     return {
         "by_cat": by_cat,
-        "total": total,
+        "total": highlights["total"],
         "total_change": total_change,
         "cat_changes": cat_changes,
         "large_purchases": large_transactions,
     }
 
 
+# def setup_spending_highlights(accounts: Iterable[FinancialAccount], person: Person, num_days: int) -> List[Tuple[TransactionCategory, List[int, float, Dict[str, str]]]]:
+def setup_spending_highlights(
+    person: Person, start_days_back: int, end_days_back: int, is_lookback: bool
+):
+    """Find the biggest recent spending highlights. Unless `is_lookback` is set, compare to
+    the period of equal length preceding this one.
+
+    Category counts and totals for both periods are aggregated by the database in a single
+    grouped query; large purchases are loaded with a second, bounded one."""
+    if start_days_back is None:  # Perhaps invalid data from the date picker.
+        start_days_back = 30
+    if end_days_back is None:
+        end_days_back = 0
+
+    now = timezone.now()
+    start, end = days_back_range(now, start_days_back, end_days_back)
+
+    in_period = Q(date__gte=start, date__lte=end)
+
+    if is_lookback:
+        window = (start, end)
+        in_prev = None
+    else:
+        prev_start, prev_end = days_back_range(
+            now, start_days_back * 2, start_days_back
+        )
+        window = (min(start, prev_start), max(end, prev_end))
+        in_prev = Q(date__gte=prev_start, date__lte=prev_end)
+
+    trans_spending = load_transactions_spending(person, *window)
+
+    aggregates = {
+        "count": Count("id", filter=in_period),
+        "total": Sum("amount", filter=in_period),
+    }
+    if in_prev is not None:
+        aggregates["total_prev"] = Sum("amount", filter=in_prev)
+
+    highlights = _highlights_blank()
+    highlights_prev = None if is_lookback else _highlights_blank()
+
+    for row in trans_spending.values("category").order_by().annotate(**aggregates):
+        if row["count"]:
+            highlights["by_cat"][row["category"]] = [row["count"], row["total"]]
+            highlights["total"] += row["total"]
+
+        if highlights_prev is not None and row["total_prev"] is not None:
+            highlights_prev["by_cat"][row["category"]] = [0, row["total_prev"]]
+            highlights_prev["total"] += row["total_prev"]
+
+    highlights["large_purchases"] = list(
+        trans_spending.filter(in_period)
+        .filter(
+            Q(amount__gte=LARGE_PURCHASE_THRESH) | Q(amount__lte=-LARGE_PURCHASE_THRESH)
+        )
+        .order_by("amount")
+        .values("description", "amount")[:LARGE_PURCHASES_MAX]
+    )
+
+    return _highlights_finish(highlights, highlights_prev)
+
+
 def setup_spending_data(
     person: Person, start_days_back: int, end_days_back: int
 ) -> dict:
-    # todo: DRY/C+P! This is bad because it repeats the same transaction query. Fix it for performance reasons.
+    """Compute everything the spending page displays: Totals, highlights, and comparisons to
+    the previous period, monthly spending and income over the past year, and new merchants.
+    We load all transactions in the widest window required once, then compute each section
+    in a single pass over them. Monthly values are read from the monthly rollup."""
+    if start_days_back is None:
+        start_days_back = 30
+    if end_days_back is None:
+        end_days_back = 0
+
     now = timezone.now()
-    start = now - timedelta(days=start_days_back)
-    end = now - timedelta(days=end_days_back)
-
-    # todo: We likely have already loaded these transactions. Optimize later.
-    # todo: Maybe cache, this and run it once in a while? Or always load 30 days of trans?
-    trans = load_transactions(None, None, person, "", start, end, None)
-
-    # todo: Other cats?
-    income_transactions = [
-        t
-        for t in trans
-        if TransactionCategory.INCOME.value == t.category and not t.ignored
-    ]
+    start, end = days_back_range(now, start_days_back, end_days_back)
+    prev_start, prev_end = days_back_range(now, start_days_back * 2, start_days_back)
 
-    income_total = 0.0
-    for t in income_transactions:
-        income_total += t.amount
+    # todo: QC this merchant check
+    baseline_start = start - timedelta(days=360)
+
+    # Monthly buckets, oldest first, for the 12 months preceding this one.
+    month_labels = []
+    month_indices = {}  # Keyed by the first day of the month.
+    for months_back in range(12, 0, -1):
+        month_start = (now - relativedelta(months=months_back)).date().replace(day=1)
 
-    expense_transactions = filter_trans_spending(trans)
+        month_indices[month_start] = len(month_labels)
+        month_labels.append(month_start.strftime("%b %y"))
+
+    spending_by_month = [0.0 for _ in month_labels]
+    income_by_month = [0.0 for _ in month_labels]
+
+    monthly_totals = (
+        MonthlyCategoryTotal.objects.filter(
+            person=person, month__in=month_indices.keys()
+        )
+        .values("month")
+        .order_by()
+        .annotate(
+            spending=Sum("total", filter=Q(spending=True)),
+            income=Sum("total", filter=Q(income=True)),
+        )
+    )
 
+    for row in monthly_totals:
+        month_i = month_indices[row["month"]]
+        spending_by_month[month_i] = row["spending"] or 0.0
+        income_by_month[month_i] = row["income"] or 0.0
+
+    window_start = min(start, prev_start, baseline_start)
+    window_end = max(end, prev_end)
+
+    income_total = 0.0
     expenses_total = 0.0
     expenses_discretionary = 0.0
     expenses_nondiscret = 0.0
 
-    for t in expense_transactions:
-        expenses_total += t.amount
+    highlights = _highlights_blank()
+    highlights_prev = _highlights_blank()
 
-        if t.category > 1_000:
-            # Assume discret for now.
-            discret = TransactionCategoryDiscret.DISCRETIONARY
-        else:
-            discret = TransactionCategoryDiscret.from_cat(
-                TransactionCategory(t.category)
-            )
+    merchants_in_range = set()
+    merchants_base = set()
 
-        if discret == TransactionCategoryDiscret.DISCRETIONARY:
-            expenses_discretionary += t.amount
-        elif discret == TransactionCategoryDiscret.NON_DISCRETIONARY:
-            expenses_nondiscret += t.amount
-        # The third option here is a non-spending expense (transfer, fee etc)
+    for tran in load_spending_rows(person, window_start, window_end):
+        spending = transaction_cats.is_spending(tran.category, tran.ignored)
 
-    # TODO. no! Doubles the query.
-    spending_highlights = setup_spending_highlights(
-        person, start_days_back, end_days_back, False
-    )
+        if start <= tran.date <= end:
+            # todo: Other cats?
+            if tran.category == TransactionCategory.INCOME.value and not tran.ignored:
+                income_total += tran.amount
 
-    spending_over_time = []
-    income_over_time = []
-    # for months_back in range(0, 12):
-    for months_back in range(12, 0, -1):
-        start_ = (now - relativedelta(months=months_back)).replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0
-        )
-        end_ = start_ + relativedelta(months=1) - timedelta(seconds=1)
+            if spending:
+                expenses_total += tran.amount
 
-        # todo: DRY with above.
-        trans_in_month = load_transactions(None, None, person, "", start_, end_, None)
+                # Assume custom categories are discretionary, for now.
+                discret = CAT_VALS_DISCRET.get(
+                    tran.category, TransactionCategoryDiscret.DISCRETIONARY
+                )
 
-        expenses_in_month = 0.0
-        expense_transactions = filter_trans_spending(trans_in_month)
-        for t in expense_transactions:
-            expenses_in_month += t.amount
-        spending_over_time.append((start_.date().strftime("%b %y"), expenses_in_month))
+                if discret == TransactionCategoryDiscret.DISCRETIONARY:
+                    expenses_discretionary += tran.amount
+                elif discret == TransactionCategoryDiscret.NON_DISCRETIONARY:
+                    expenses_nondiscret += tran.amount
+                # The third option here is a non-spending expense (transfer, fee etc)
 
-        income_in_month = 0.0
-        income_transactions = [
-            t for t in trans_in_month if TransactionCategory.INCOME.value == t.category
-        ]
-        for t in income_transactions:
-            income_in_month += t.amount
-        income_over_time.append((start_.date().strftime("%b %y"), income_in_month))
+                _highlights_add(highlights, tran)
 
-    # todo: QC this merchant check
-    start_new_merchant_check = start - timedelta(days=360)
-    merchants_new = find_new_merchants(
-        person, (start, end), (start_new_merchant_check, start)
-    )
+            merchants_in_range.add((tran.merchant.lower(), tran.logo_url))
+
+        if spending and prev_start <= tran.date <= prev_end:
+            _highlights_add(highlights_prev, tran)
+
+        if baseline_start <= tran.date <= start:
+            merchants_base.add(tran.merchant.lower())
+
+    merchants_new = [m for m in merchants_in_range if m[0] not in merchants_base]
 
     return {
-        "highlights": spending_highlights,
+        "highlights": _highlights_finish(highlights, highlights_prev),
         "income_total": income_total,
         "expenses_total": expenses_total,
         "expenses_discretionary": expenses_discretionary,
         "expenses_nondiscret": expenses_nondiscret,
-        "spending_over_time": spending_over_time,
-        "income_over_time": income_over_time,
+        "spending_over_time": list(zip(month_labels, spending_by_month)),
+        "income_over_time": list(zip(month_labels, income_by_month)),
         "merchants_new": merchants_new,
     }
 
@@ -475,18 +725,85 @@ def check_account_status(request: HttpRequest) -> Optional[HttpResponse]:
         )
 
 
-def change_tran_cats_from_rule(rule: CategoryRule, person: Person):
+def change_tran_cats_from_rule(rule: CategoryRule, person: Person) -> int:
     """This is a bit of a forward decision, but retroactively re-categorize transactions matching
-    a given description, based on a new or updated rule."""
+    a given description, based on a new or updated rule. Returns the number of transactions changed.
+    """
+    return apply_rules([rule], person)
+
+
+def apply_rules(rules: Iterable[CategoryRule], person: Person) -> int:
+    """Retroactively re-categorize a person's transactions matching the descriptions of a set of
+    rules. This uses a single UPDATE, with a CASE expression, per `RULES_PER_UPDATE` rules. Returns
+    the number of transactions changed. Call `rules_changed` first."""
+    # We resolve each description with the same matcher used when categorizing new transactions,
+    # so both give the same category; eg if multiple rules have the same normalized description.
+    matcher = rule_matcher(person)
+
+    items = []
+    for descrip in sorted({rule.description_norm for rule in rules}):
+        cat = matcher.match(descrip)
+        if cat is not None:
+            items.append((descrip, cat))
+
+    num_changed = 0
+    dates_touched = set()
+
+    with transaction.atomic():
+        for i in range(0, len(items), RULES_PER_UPDATE):
+            chunk = items[i : i + RULES_PER_UPDATE]
+
+            # Only match transactions whose category would change.
+            match = Q()
+            for descrip, cat in chunk:
+                match |= Q(description_norm=descrip) & ~Q(category=cat)
+
+            trans = Transaction.objects.filter(match, owner=person)
+
+            dates_touched.update(trans.values_list("date", flat=True).distinct())
+            num_changed += trans.update(
+                category=Case(
+                    *[
+                        When(description_norm=descrip, then=Value(cat))
+                        for descrip, cat in chunk
+                    ],
+                    default=F("category"),
+                )
+            )
+
+        rollups.refresh_monthly_totals(person, dates_touched)
+
+    if num_changed:
+        data_changed(person)
+
+    return num_changed
+
 
-    # todo: Make this mor egeneral, like when you recategorize new transactions based on rules. stripping whitespace,
-    # todo, chars like ', & etc.
-    for tran in Transaction.objects.filter(
-        Q(person=person) | Q(account__person=person),
-        description__iexact=rule.description,
-    ):
-        tran.category = rule.category
-        tran.save()
+def rule_matcher(person: Person) -> transaction_cats.RuleMatcher:
+    """Load a person's category rules, compiled for matching against many transactions. This is
+    cached until their rules change; see `rules_changed`."""
+    key = f"rule_matcher_{person.id}_{person.rules_version}"
+
+    matcher = cache.get(key)
+    if matcher is None:
+        matcher = RuleMatcher(person.category_rules.all())
+        cache.set(key, matcher, RULE_MATCHER_CACHE_TIMEOUT)
+
+    return matcher
+
+
+def rules_changed(person: Person):
+    """Call this after adding, editing, or deleting a person's category rules."""
+    Person.objects.filter(id=person.id).update(rules_version=F("rules_version") + 1)
+    person.refresh_from_db(fields=["rules_version"])
+
+
+def data_changed(person: Person):
+    """Call this after changing a person's accounts or transactions, so their cached dashboard data
+    isn't used. Call it after the writes, vice before, so a concurrent load can't cache the old
+    data under the new version."""
+    Person.objects.filter(id=person.id).update(data_version=F("data_version") + 1)
+    person.refresh_from_db(fields=["data_version"])
 
 
 def send_debug_email(message: str):
@@ -532,14 +849,19 @@ def find_new_merchants(
 
 def spending_this_month(cat: TransactionCategory, person: Person) -> float:
     """For use in Budget: Find the spending amount in the current calendar month, in this transaction category"""
-    now = timezone.now()
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_end = month_start + relativedelta(months=1) - timedelta(seconds=1)
+    return spending_by_cat_this_month(person).get(cat.value, 0.0)
 
-    trans = load_transactions(None, None, person, None, month_start, month_end, cat)
 
-    total = 0.0
-    for t in trans:
-        total += t.amount
+def spending_by_cat_this_month(person: Person) -> Dict[int, float]:
+    """For use in Budget: Find the spending amount in the current calendar month, for each transaction
+    category. Reads from the monthly rollup."""
+    totals = (
+        MonthlyCategoryTotal.objects.filter(
+            person=person, month=timezone.localdate().replace(day=1)
+        )
+        .values("category")
+        .order_by()
+        .annotate(total=Sum("total"))
+    )
 
-    return total
+    return {t["category"]: t["total"] for t in totals}
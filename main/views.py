@@ -1,11 +1,9 @@
 import json
 from datetime import date, timedelta, datetime
-from io import TextIOWrapper
 from zoneinfo import ZoneInfo
 from django.db.models import Max
 import re
 
-from django.db.models import Q
 from django import forms
 
 from wallet.settings import DEPLOYED
@@ -13,9 +11,9 @@ from . import export
 
 from django.contrib.auth import login, authenticate, logout, user_login_failed
 from django.contrib.auth.forms import UserCreationForm
-from django.db import OperationalError, IntegrityError
+from django.db import OperationalError, IntegrityError, transaction
 from django.dispatch import receiver
-from django.http import HttpResponse, HttpRequest, JsonResponse
+from django.http import HttpResponse, HttpRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
@@ -41,6 +39,9 @@ from main.models import (
     CategoryRule,
     CategoryCustom,
     BudgetItem,
+    JobStatus,
+    SyncJob,
+    ImportJob,
 )
 
 import plaid
@@ -50,7 +51,7 @@ from plaid.model.item_public_token_exchange_request import (
 )
 
 
-from main import plaid_, util
+from main import plaid_, util, rollups, jobs
 from main.plaid_ import (
     CLIENT,
     ACCOUNT_REFRESH_INTERVAL_RECURRING,
@@ -61,6 +62,10 @@ from .util import send_debug_email
 
 MAX_LOGIN_ATTEMPTS = 5
 
+# For loading transactions by keyset, if the page size isn't specified.
+TRANSACTIONS_PAGE_SIZE = 60
+TRANSACTIONS_PAGE_SIZE_MAX = 500
+
 
 def load_body(request: HttpRequest) -> dict:
     """Helper function"""
@@ -75,14 +80,15 @@ def landing(request: HttpRequest) -> HttpResponse:
 
 @login_required
 def load_transactions(request: HttpRequest) -> HttpResponse:
-    """Load transactions based on criteria passed in the POST body. Return them as JSON."""
+    """Load transactions based on criteria passed in the POST body. Return them as JSON.
+
+    If `cursor` is included in the body, (`null` for the first page), pages are loaded by keyset,
+    and the response includes `next_cursor`. Otherwise, the `start_i` and `end_i` indices are used.
+    """
     person = request.user.person
 
     data = load_body(request)
-    # todo: Use pages or last index A/R.
 
-    start_i = data["start_i"]
-    end_i = data["end_i"]
     search = data.get("search")
     category = data.get("category")
     start = data.get("start")
@@ -109,6 +115,31 @@ def load_transactions(request: HttpRequest) -> HttpResponse:
     if category == -2:
         category = None
 
+    if "cursor" in data:
+        try:
+            page_size = int(data.get("page_size") or TRANSACTIONS_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return JsonResponse({"success": False}, status=400)
+
+        page_size = max(1, min(page_size, TRANSACTIONS_PAGE_SIZE_MAX))
+
+        try:
+            tran, next_cursor = util.load_transactions_page(
+                person, search, start, end, category, data["cursor"], page_size
+            )
+        except ValueError:
+            return JsonResponse({"success": False}, status=400)
+
+        return JsonResponse(
+            {
+                "transactions": [t.serialize() for t in tran],
+                "next_cursor": next_cursor,
+            }
+        )
+
+    start_i = data["start_i"]
+    end_i = data["end_i"]
+
     tran = util.load_transactions(start_i, end_i, person, search, start, end, category)
 
     transactions = {
@@ -141,11 +172,13 @@ def edit_transactions(request: HttpRequest) -> HttpResponse:
     result = {"success": True}
     person = request.user.person
 
+    dates_touched = []
+    rules_created = []
+
     for tran in data.get("transactions", []):
         try:
             tran_db = Transaction.objects.get(
-                (Q(account__person=request.user.person) | Q(person=request.user.person))
-                & Q(id=tran["id"])
+                owner=request.user.person, id=tran["id"]
             )  # Prevent exploits
         except Transaction.DoesNotExist:
             msg = f"\nCan't find this transaction to edit: {tran}, {request.user}"
@@ -155,6 +188,8 @@ def edit_transactions(request: HttpRequest) -> HttpResponse:
 
         # todo: Don't override the original description for a linked transaction; use a separate field.
 
+        dates_touched.extend([tran_db.date, tran["date"]])
+
         tran_db.category = tran["category"]
         tran_db.description = tran["description"]
         tran_db.institution_name = tran["institution_name"]
@@ -164,7 +199,12 @@ def edit_transactions(request: HttpRequest) -> HttpResponse:
         tran_db.ignored = tran.get("ignored", False)
 
         try:
-            tran_db.save()
+            with transaction.atomic():
+                # Serializes this with CSV imports for this person; see `export.import_batch`.
+                Person.objects.select_for_update().filter(
+                    id=request.user.person.id
+                ).first()
+                tran_db.save()
         except IntegrityError:
             msg = f"\n\n Integrity error when editing a transaction!: \n{tran_db}"
             print(msg)
@@ -177,8 +217,15 @@ def edit_transactions(request: HttpRequest) -> HttpResponse:
                 description=tran_db.description,
                 defaults={"category": tran["category"]},
             )
+            rules_created.append(rule_db)
 
-            util.change_tran_cats_from_rule(rule_db, person)
+    rollups.refresh_monthly_totals(person, dates_touched)
+
+    if rules_created:
+        util.rules_changed(person)
+        util.apply_rules(rules_created, person)
+
+    util.data_changed(person)
 
     return JsonResponse(result)
 
@@ -189,12 +236,15 @@ def add_transactions(request: HttpRequest) -> HttpResponse:
     data = load_body(request)
     result = {"success": True}
 
+    dates_touched = []
+
     for tran in data.get("transactions", []):
         # todo: Do it.
 
         tran_db = Transaction(
             account=None,
             person=request.user.person,
+            owner=request.user.person,
             institution_name=tran["institution_name"],
             category=tran["category"],
             amount=tran["amount"],
@@ -206,8 +256,14 @@ def add_transactions(request: HttpRequest) -> HttpResponse:
         )
 
         try:
-            tran_db.save()
+            with transaction.atomic():
+                # Serializes this with CSV imports for this person; see `export.import_batch`.
+                Person.objects.select_for_update().filter(
+                    id=request.user.person.id
+                ).first()
+                tran_db.save()
             print("Tran adding: ", tran_db)
+            dates_touched.append(tran_db.date)
 
             # todo: This id setup is not set up to handle multiple. Fine for now.
             result = {"success": True, "ids": [tran_db.id]}
@@ -218,6 +274,9 @@ def add_transactions(request: HttpRequest) -> HttpResponse:
                 "success": False,
             }
 
+    rollups.refresh_monthly_totals(request.user.person, dates_touched)
+    util.data_changed(request.user.person)
+
     return JsonResponse(result)
 
 
@@ -229,10 +288,16 @@ def edit_accounts(request: HttpRequest) -> HttpResponse:
     data = load_body(request)
     result = {"success": True}
 
-    for acc in data.get("accounts", []):
-        acc_db = SubAccount.objects.get(
-            Q(id=acc["id"]) & (Q(person=person) | Q(account__person=person))
-        )
+    accounts = data.get("accounts", [])
+    # One query to load the accounts, and one to save them, vice one of each per account.
+    by_id = SubAccount.objects.filter(owner=person).in_bulk(
+        [acc["id"] for acc in accounts]
+    )
+
+    for acc in accounts:
+        acc_db = by_id.get(acc["id"])
+        if acc_db is None:
+            return JsonResponse({"success": False}, status=404)
 
         acc_db.name = acc["name"]
         acc_db.nickname = acc["nickname"]
@@ -247,7 +312,19 @@ def edit_accounts(request: HttpRequest) -> HttpResponse:
             acc_db.iso_currency_code = acc["iso_currency_code"]
             acc_db.current = acc["current"]
 
-        acc_db.save()
+    SubAccount.objects.bulk_update(
+        by_id.values(),
+        [
+            "name",
+            "nickname",
+            "asset_type",
+            "asset_quantity",
+            "iso_currency_code",
+            "current",
+        ],
+    )
+
+    util.data_changed(person)
 
     return JsonResponse(result)
 
@@ -264,6 +341,7 @@ def add_account_manual(request: HttpRequest) -> HttpResponse:
 
     account = SubAccount(
         person=request.user.person,
+        owner=request.user.person,
         name=data["name"],
         type=account_type.value,
         sub_type=sub_type.value,
@@ -286,6 +364,8 @@ def add_account_manual(request: HttpRequest) -> HttpResponse:
         print("Integrity error on saving a manual account")
         success = False
 
+    util.data_changed(request.user.person)
+
     return JsonResponse({"success": success, "account": account.serialize()})
 
 
@@ -301,27 +381,30 @@ def delete_accounts(request: HttpRequest) -> HttpResponse:
     for id_ in data.get("ids", []):
         try:
             # person and account checks prevent abuse.
-            sub_acc = SubAccount.objects.get(
-                Q(id=id_) & (Q(person=person) | Q(account__person=person))
-            )
+            sub_acc = SubAccount.objects.get(id=id_, owner=person)
         except SubAccount.DoesNotExist:
             result["success"] = False
             print("\nProblem finding the sub-account")
+            # Accounts earlier in the list may have been deleted.
+            util.data_changed(person)
             return JsonResponse(result)
 
         # Delete the parent Account, if it's a linked account.
         if sub_acc.account is not None:
             acc = sub_acc.account
-            # Associate the transactions with the person, so it will still be loaded.
-            for tran in acc.transactions.all():
-                tran.person = person
-                tran.save()
+            # Associate the transactions with the person, so they're kept as manual transactions. Their
+            # `owner` is already the person.
+            acc.transactions.update(person=person)
+            # Sub-accounts would otherwise be detached from the account, but still owned by the person.
+            acc.sub_accounts.all().delete()
             acc.delete()
 
         # If it's a manual account, just delete the sub-account.
         else:
             sub_acc.delete()
 
+    util.data_changed(person)
+
     return JsonResponse(result)
 
 
@@ -331,18 +414,15 @@ def delete_transactions(request: HttpRequest) -> HttpResponse:
     data = load_body(request)
     result = {"success": True}
 
+    dates_touched = []
+
     for id_ in data.get("ids", []):
         try:
             # The person check prevents abuse
 
-            tran = Transaction.objects.get(
-                Q(id=id_)
-                & (
-                    Q(account__person=request.user.person)
-                    | Q(person=request.user.person)
-                )
-            )
+            tran = Transaction.objects.get(id=id_, owner=request.user.person)
             tran.delete()
+            dates_touched.append(tran.date)
         except Transaction.DoesNotExist:
             if not DEPLOYED:
                 msg = f"\nCan't find this transaction to delete: {id_}, {request.user}"
@@ -351,6 +431,9 @@ def delete_transactions(request: HttpRequest) -> HttpResponse:
                     send_debug_email(msg)
             result["success"] = False
 
+    rollups.refresh_monthly_totals(request.user.person, dates_touched)
+    util.data_changed(request.user.person)
+
     return JsonResponse(result)
 
 
@@ -396,35 +479,69 @@ def dashboard(request: HttpRequest) -> HttpResponse:
 
 @login_required
 def post_dash_load(request: HttpRequest) -> HttpResponse:
-    """This performs actions after a dashboard initial  load, such as refreshing
-    account data."""
-    print("Post dash load...")  # todo temp
+    """This performs actions after a dashboard initial load, such as refreshing
+    account data. The refresh is queued for the sync worker; the page polls `sync_status` for
+    its result."""
+    job = jobs.enqueue_sync(request.user.person)
+
+    return JsonResponse({"job": job.id if job is not None else None})
+
 
+@login_required
+def sync_status(request: HttpRequest) -> HttpResponse:
+    """The status of a queued account sync. Once done, if new data was loaded, includes balances
+    and transactions for the UI."""
     person = request.user.person
-    accounts = person.accounts.all()
+
+    try:
+        job_id = int(request.GET.get("job", ""))
+    except ValueError:
+        return JsonResponse({"success": False}, status=400)
+
+    job = SyncJob.objects.filter(id=job_id, person=person).first()
+    if job is None:
+        return JsonResponse({"success": False}, status=404)
 
     data = {
+        "status": JobStatus(job.status).name.lower(),
         "totals": {},
         "sub_accs": [],
         "transactions": [],
         "acc_health": [],
     }
 
-    # Get new balance and transaction data from Plaid. This only populates if there is new data available.
-    if plaid_.update_accounts(accounts):
-        # Send balances and transactions to the UI, if new data is available.
-        data = util.load_dash_data(request.user.person, no_preser=True)
+    # Send balances and transactions to the UI, if new data is available.
+    if job.status == JobStatus.DONE.value and job.new_data:
+        data.update(util.load_dash_data(person, no_preser=True))
 
-        # Save snapshots, for use with charts, etc
-        # todo: We need to make sure this is called regularly, even if the user doesn't log into the page.
-        util.take_snapshots(accounts, person)
+    return JsonResponse(data)
 
-        sub_accounts = SubAccount.objects.filter(
-            Q(account__person=person) | Q(person=person)
-        )
-        data["totals"] = util.create_totals(sub_accounts)
 
-    return JsonResponse(data)
+@login_required
+def import_status(request: HttpRequest, job_id: int) -> HttpResponse:
+    """The progress of a queued CSV import."""
+    job = ImportJob.objects.filter(id=job_id, person=request.user.person).first()
+    if job is None:
+        return JsonResponse({"success": False}, status=404)
+
+    rows_per_second = 0.0
+    if job.started is not None:
+        elapsed = ((job.finished or timezone.now()) - job.started).total_seconds()
+        if elapsed > 0:
+            rows_per_second = job.rows_processed / elapsed
+
+    return JsonResponse(
+        {
+            "status": JobStatus(job.status).name.lower(),
+            "rows_processed": job.rows_processed,
+            "rows_per_second": round(rows_per_second, 1),
+            "inserted": job.inserted,
+            "skipped": job.skipped,
+            "malformed": job.malformed,
+            # The full error is in the job's `error` field; we don't expose tracebacks.
+            "error": ("Import failed" if job.status == JobStatus.FAILED.value else ""),
+        }
+    )
 
 
 @login_required
@@ -458,9 +575,7 @@ def create_link_token_update(request: HttpRequest) -> HttpResponse:
 
     # Possibly a check here that there is an account for this sub-acc, but there should
     # always be, if we got this far in the re-link process.
-    account = SubAccount.objects.get(
-        Q(id=data["id"]) & (Q(person=person) | Q(account__person=person))
-    ).account
+    account = SubAccount.objects.get(id=data["id"], owner=person).account
 
     print(f"Acc to re-link: {account}")
 
@@ -484,6 +599,8 @@ def create_link_token_update(request: HttpRequest) -> HttpResponse:
     account.needs_attention = False
     account.save()
 
+    util.data_changed(request.user.person)
+
     return JsonResponse({"link_token": link_token})
 
 
@@ -591,6 +708,9 @@ def exchange_public_token(request: HttpRequest) -> HttpResponse:
         send_debug_email(msg)
 
         success = False
+
+    util.data_changed(person)
+
     return JsonResponse({"success": success})
 
 
@@ -625,11 +745,11 @@ def budget(request: HttpRequest) -> HttpResponse:
 
     custom_cats = CategoryCustom.objects.filter(person=request.user.person)
 
+    spending_by_cat = util.spending_by_cat_this_month(person)
+
     budget_items = []
     for b in budget_items_:
-        amount = util.spending_this_month(
-            TransactionCategory(TransactionCategory(b.category)), person
-        )
+        amount = spending_by_cat.get(b.category, 0.0)
         budget_items.append((b, str(amount).replace("-", "")))
 
     # todo: Make sure custom categories here work.
@@ -659,9 +779,11 @@ def recurring(request: HttpRequest) -> HttpResponse:
             plaid_.refresh_recurring(acc)
             acc.last_refreshed_recurring = timezone.now()
 
-    recur = RecurringTransaction.objects.filter(
-        Q(account__person=person) | Q(account__account__person=person)
-    ).filter(is_active=True)
+    recur = (
+        RecurringTransaction.objects.filter(account__owner=person, is_active=True)
+        # The template shows each one's institution.
+        .select_related("account__account__institution")
+    )
 
     context = {"recurring": recur}
 
@@ -674,11 +796,12 @@ def settings(request: HttpRequest) -> HttpResponse:
 
     if request.method == "POST":
         if request.FILES:
+            # Large files take longer to import than we allow for a request, so we queue them for
+            # a worker; the page polls `import_status` for progress.
             uploaded_file = request.FILES["file"]
-            file_data = TextIOWrapper(uploaded_file.file, encoding="utf-8")
-            export.import_csv_mint(file_data, request.user.person)
+            job = jobs.enqueue_import(request.user.person, uploaded_file.read())
 
-            return HttpResponseRedirect("/settings")
+            return HttpResponseRedirect(f"/settings?import_job={job.id}")
 
         form = SetPasswordForm(request.user, request.POST)
 
@@ -708,6 +831,7 @@ def settings(request: HttpRequest) -> HttpResponse:
             for c in CategoryCustom.objects.filter(person=request.user.person)
         ],
         "password_change": False,
+        "import_job": request.GET.get("import_job", ""),
     }
 
     return render(request, "settings.html", context)
@@ -888,21 +1012,15 @@ class UploadFileForm(forms.Form):
 
 
 @login_required
-def export_(request: HttpRequest) -> HttpResponse:
+def export_(request: HttpRequest) -> StreamingHttpResponse:
     filename = f"transaction_export_{timezone.now().date().isoformat()}.csv"
 
-    response = HttpResponse(
+    response = StreamingHttpResponse(
+        export.export_csv(request.user.person),
         content_type="text/csv",
     )
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
 
-    export.export_csv(
-        Transaction.objects.filter(
-            Q(account__person=request.user.person) | Q(person=request.user.person)
-        ),
-        response,
-    )
-
     return response
 
 
@@ -917,6 +1035,9 @@ def edit_rules(request: HttpRequest) -> HttpResponse:
     data = load_body(request)
     person = request.user.person
 
+    # Rules added or edited; we apply these to existing transactions together.
+    rules_changed = []
+
     for rule in data["edited"]:
         rule_db, _ = CategoryRule.objects.update_or_create(
             person=person,
@@ -926,7 +1047,7 @@ def edit_rules(request: HttpRequest) -> HttpResponse:
                 "category": rule["category"],
             },
         )
-        util.change_tran_cats_from_rule(rule_db, person)
+        rules_changed.append(rule_db)
 
     for rule in data["added"]:
         # The person check here prevents abuse by the frontend.
@@ -948,7 +1069,7 @@ def edit_rules(request: HttpRequest) -> HttpResponse:
         while not success:
             try:
                 rule_db.save()
-                util.change_tran_cats_from_rule(rule_db, person)
+                rules_changed.append(rule_db)
                 success = True
             except IntegrityError:
                 attempt += 1
@@ -980,13 +1101,14 @@ def edit_rules(request: HttpRequest) -> HttpResponse:
             #     except IntegrityError:
             #         print(f"\nIntegrity error when saving a new category rule: {rule_db}\n")
             #         success = False
-            else:
-                util.change_tran_cats_from_rule(rule_db, person)
 
     for id_ in data["deleted"]:
         # The person check here prevents abuse by the frontend.
         CategoryRule.objects.get(id=id_, person=person).delete()
 
+    util.rules_changed(person)
+    util.apply_rules(rules_changed, person)
+
     return JsonResponse({"success": success})
 
 
@@ -1245,14 +1367,15 @@ def toggle_highlight(request: HttpRequest) -> HttpResponse:
     """Toggle a transactions highlight status."""
     data = load_body(request)
 
-    tran = Transaction.objects.filter(id=data["id"])
-    tran = tran.filter(
-        Q(account__person=request.user.person) | Q(person=request.user.person)
+    tran = Transaction.objects.filter(
+        id=data["id"], owner=request.user.person
     ).first()  # Prevent exploits
 
     tran.highlighted = not tran.highlighted
     tran.save()
 
+    util.data_changed(request.user.person)
+
     return JsonResponse({"success": True})
 
 
@@ -1262,12 +1385,14 @@ def toggle_ignore(request: HttpRequest) -> HttpResponse:
     """Toggle a transactions ignore status."""
     data = load_body(request)
 
-    tran = Transaction.objects.filter(id=data["id"])
-    tran = tran.filter(
-        Q(account__person=request.user.person) | Q(person=request.user.person)
+    tran = Transaction.objects.filter(
+        id=data["id"], owner=request.user.person
     ).first()  # Prevent exploits
 
     tran.ignored = not tran.ignored
     tran.save()
 
+    rollups.refresh_monthly_totals(request.user.person, [tran.date])
+    util.data_changed(request.user.person)
+
     return JsonResponse({"success": True})
@@ -16,6 +16,13 @@ let QUICK_CAT_SEARCH = ""
 // Whenever we change page, or filter terms, we may need to load transactions. This tracks
 // if we've already done so, for a given config
 let TRANSACTIONS_LOADED = true
+// Points to where the next request for transactions continues from, for the current filter terms.
+// The server returns it with each page; null loads the first page.
+let TRAN_CURSOR = null
+// True once the server has no more transactions matching the current filter terms.
+let TRAN_CURSOR_DONE = false
+// Incremented whenever filter terms change, so we can ignore cursors from responses to old ones.
+let TRAN_FILTER_VERSION = 0
 
 const PAGE_SIZE = 60
 
@@ -30,6 +37,10 @@ const THRESH_HIGH_AMOUNT = 200
 // Show this many items in the highlights category, per section.
 const HIGHLIGHTS_SIZE = 5
 
+// How often, in ms, and how many times we check on a queued account sync.
+const SYNC_POLL_INTERVAL = 2000
+const SYNC_POLL_MAX_ATTEMPTS = 60
+
 
 // let TRANSACTIONS_DISPLAYED = []
 let TRANSACTION_ICONS = true
@@ -198,16 +209,17 @@ function filterTransactions() {
         TRANSACTIONS_LOADED = true
 
         // If, after filtering, we don't have a full page of information, request more from the backend.
-        if (transactions.length < PAGE_SIZE) {
+        if (transactions.length < PAGE_SIZE && !TRAN_CURSOR_DONE) {
             console.log("Requesting more transactions...")
             const data = {
-                start_i: startI,
-                end_i: endI,
+                cursor: TRAN_CURSOR,
+                page_size: PAGE_SIZE,
                 search: SEARCH_TEXT,
                 start: FILTER_START,
                 end: FILTER_END,
                 category: FILTER_CAT,
             }
+            const filterVersion = TRAN_FILTER_VERSION
 
             fetch("/load-transactions", {body: JSON.stringify(data), ...FETCH_HEADERS_POST})
                 .then(result => result.json())
@@ -221,6 +233,18 @@ function filterTransactions() {
                         }
                     }
 
+                    // The filter terms changed while this was loading; its cursor doesn't apply.
+                    if (filterVersion === TRAN_FILTER_VERSION) {
+                        TRAN_CURSOR = r.next_cursor
+
+                        if (TRAN_CURSOR === null) {
+                            TRAN_CURSOR_DONE = true
+                        } else {
+                            // Keep loading until this page is full, or there are no more.
+                            TRANSACTIONS_LOADED = false
+                        }
+                    }
+
                     refreshTransactions()
                 });
         }
@@ -832,8 +856,16 @@ function refreshTransactions() {
     }
 }
 
+function resetTranCursor() {
+    // Call this when filter terms change, so we load transactions from the start for the new ones.
+    TRAN_CURSOR = null
+    TRAN_CURSOR_DONE = false
+    TRAN_FILTER_VERSION += 1
+}
+
 function updateTranFilter() {
     TRANSACTIONS_LOADED = false // Allows more transactions to be loaded from the server.
+    resetTranCursor()
 
     SEARCH_TEXT = getEl("search").value.toLowerCase()
 
@@ -1373,12 +1405,65 @@ function setupCatFilter(searchText) {
     sel.addEventListener("input", e => {
         FILTER_CAT = parseInt(e.target.value)
         TRANSACTIONS_LOADED = false
+        resetTranCursor()
         refreshTransactions()
     })
 
     div.appendChild(sel)
 }
 
+// Poll the status of a queued account sync, until it finishes, or we give up.
+function pollSyncStatus(jobId, attempt) {
+    if (attempt >= SYNC_POLL_MAX_ATTEMPTS) {
+        return
+    }
+
+    setTimeout(() => {
+        fetch("/sync-status?job=" + jobId.toString(), FETCH_HEADERS_GET)
+            .then(result => result.json())
+            .then(r => {
+                if (r.status === "queued" || r.status === "running") {
+                    pollSyncStatus(jobId, attempt + 1)
+                    return
+                }
+
+                if (r.status === "done") {
+                    applySyncResult(r)
+                }
+            });
+    }, SYNC_POLL_INTERVAL)
+}
+
+// Update accounts and transactions from a finished account sync.
+function applySyncResult(r) {
+    TOTALS = r.totals
+
+    // refreshIndicator.style.visibility = "collapse" // todo A/R
+    // todo: Loading/spinning indicator on screen until the update is complete.
+    for (let acc_new of r.sub_accs) {
+        ACCOUNTS = [
+            ...ACCOUNTS.filter(a => a.id !== acc_new.id),
+            acc_new
+        ]
+    }
+
+    for (let tran_new of r.transactions) {
+        TRANSACTIONS = [
+            ...TRANSACTIONS.filter(a => a.id !== tran_new.id),
+            tran_new
+        ]
+    }
+    if (r.sub_accs.length > 0 || r.acc_health.length > 0) {
+        ACC_HEALTH = r.acc_health
+        refreshAccounts()
+    }
+    if (r.transactions.length > 0) {
+        refreshTransactions()
+        // todo: This won't work until you also update spending highlights.
+        setupSpendingHighlights()
+    }
+}
+
 function init() {
     // We run this on page load
     getEl("link-button").addEventListener("click", _ => {
@@ -1432,36 +1517,14 @@ function init() {
     // let refreshIndicator = getEl("refreshing-indicator")
     // refreshIndicator.style.visibility = "visible"
 
-    // Tell the backend to start updating account data values etc, and receive updates based on that here.
+    // Tell the backend to queue updating account data values etc. We poll for its result, and
+    // receive updates based on that here.
     fetch("/post-dash-load", FETCH_HEADERS_GET)
         // Parse JSON if able.
         .then(result => result.json())
         .then(r => {
-            TOTALS = r.totals
-
-            // refreshIndicator.style.visibility = "collapse" // todo A/R
-            // todo: Loading/spinning indicator on screen until the update is complete.
-            for (let acc_new of r.sub_accs) {
-                ACCOUNTS = [
-                    ...ACCOUNTS.filter(a => a.id !== acc_new.id),
-                    acc_new
-                ]
-            }
-
-            for (let tran_new of r.transactions) {
-                TRANSACTIONS = [
-                    ...TRANSACTIONS.filter(a => a.id !== tran_new.id),
-                    tran_new
-                ]
-            }
-            if (r.sub_accs.length > 0 || r.acc_health.length > 0) {
-                ACC_HEALTH = r.acc_health
-                refreshAccounts()
-            }
-            if (r.transactions.length > 0) {
-                refreshTransactions()
-                // todo: This won't work until you also update spending highlights.
-                setupSpendingHighlights()
+            if (r.job !== null) {
+                pollSyncStatus(r.job, 0)
             }
         });
 
@@ -30,6 +30,15 @@ DEPLOYED = True if "DATABASE_URL" in os.environ else False
 
 PLAID_MODE = PlaidMode.SANDBOX
 
+# The most institutions we sync from Plaid at once, for a given person.
+PLAID_SYNC_CONCURRENCY = int(os.environ.get("PLAID_SYNC_CONCURRENCY", 4))
+
+# Where we load asset prices from; "coinbase", or "static" for fixed prices without network access.
+ASSET_PRICE_PROVIDER = os.environ.get("ASSET_PRICE_PROVIDER", "coinbase")
+
+# A bearer token for scraping the `/metrics` endpoint. If unset, only staff users can view it.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 if DEPLOYED:
     DEBUG = False
     SECRET_KEY = os.environ["SECRET_KEY"]
@@ -96,6 +105,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include the other middleware.
+    "main.metrics.MetricsMiddleware",
     "django.middleware.gzip.GZipMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
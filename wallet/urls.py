@@ -18,7 +18,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from main import views
+from main import metrics, views
 
 urlpatterns = [
     # path("accounts/", include("django.contrib.auth.urls")),
@@ -69,6 +69,9 @@ urlpatterns = [
     path("edit-budget-items", views.edit_budget_items),
     path("delete-accounts", views.delete_accounts),
     path("post-dash-load", views.post_dash_load),
+    path("sync-status", views.sync_status),
+    path("import-status/<int:job_id>", views.import_status),
+    path("metrics", metrics.metrics),
     path("toggle-highlight", views.toggle_highlight),
     path("toggle-ignore", views.toggle_ignore),
     path("delete-user-account", views.delete_user_account),